@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+import argparse
+import contextlib
+import csv
+import datetime
+import io
+import json
+import math
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from book_show_types import *
+import parsing
+import printing
+
+
+# Files that are copied as-is into synthetic input directories
+_template_filenames = ['template.html', 'template-print.html']
+
+
+def read_csv(filename: str) -> Tuple[List[str], List[List[str]]]:
+	"""
+	:return: (header row, all non-blank rows after it)
+	"""
+	with open(filename, newline='') as f:
+		reader = csv.reader(f)
+		header = next(reader)
+		return header, [row for row in reader if any(row)]
+
+
+def write_csv(filename: str, header: List[str], rows: List[List[str]]):
+	with open(filename, 'w', newline='') as f:
+		writer = csv.writer(f, lineterminator='\n')
+		writer.writerow(header)
+		writer.writerows(rows)
+
+
+def copy_suffix(copy: int) -> str:
+	"""Suffix to keep names unique when tiling copies of the real data"""
+	return '' if copy == 0 else ' (%i)' % (copy + 1)
+
+
+def generate_dataset(base_dir: str, out_dir: str, scale: float) -> Dict[str, int]:
+	"""Generate synthetic input files with about scale times as much table data as base_dir
+
+	Made by tiling copies of the real data, so names, POVs & connection density stay realistic. Chapters and episodes
+	are each scaled by sqrt(scale), so table cells & connections are scaled by scale. The structure the parser depends
+	on (6 books, with books 4 & 5 combined) is kept the same.
+
+	:return: dict of row counts: chapters, episodes, connections, input_rows
+	"""
+
+	os.makedirs(out_dir, exist_ok=True)
+
+	factor = math.sqrt(scale)
+
+	books_filename, chapters_filename, combined_filename, episodes_filename, connections_filename = \
+		parsing.get_input_filenames(base_dir)
+
+	# Books - same as the real ones
+
+	shutil.copyfile(books_filename, os.path.join(out_dir, 'books.csv'))
+
+	_, book_rows = read_csv(books_filename)
+	book_names = [row[0] for row in book_rows]
+
+	# Chapters
+
+	chapters_header, chapter_rows = read_csv(chapters_filename)
+
+	real_chapters = {name: [] for name in book_names}  # book name -> rows
+	for row in chapter_rows:
+		real_chapters[row[0]].append(row)
+
+	num_chapters = {name: max(1, round(len(rows) * factor)) for name, rows in real_chapters.items()}
+
+	out_chapter_rows = []
+	chapter_names = {}  # (book number, chapter index in book) -> name
+	for book_num, book_name in enumerate(book_names, 1):
+		rows = real_chapters[book_name]
+		for idx in range(num_chapters[book_name]):
+			copy, real_idx = divmod(idx, len(rows))
+			row = list(rows[real_idx])
+			row[1] = str(idx)
+			row[2] += copy_suffix(copy)
+			out_chapter_rows.append(row)
+			chapter_names[(book_num, idx)] = row[2]
+
+	write_csv(os.path.join(out_dir, 'chapters.csv'), chapters_header, out_chapter_rows)
+
+	# Combined order - tile the real order, with each copy covering the next block of chapters
+
+	with open(combined_filename) as f:
+		combined_lines = [line.split() for line in f if line.strip()]
+
+	real_book_lengths = {'affc': len(real_chapters[book_names[3]]), 'adwd': len(real_chapters[book_names[4]])}
+	scaled_book_lengths = {'affc': num_chapters[book_names[3]], 'adwd': num_chapters[book_names[4]]}
+
+	with open(os.path.join(out_dir, 'combined.txt'), 'w') as f:
+		for copy in range(math.ceil(factor)):
+			for words in combined_lines:
+				lower_words = [word.lower() for word in words]
+				book = 'affc' if 'affc' in lower_words else 'adwd'
+				n = lower_words.index(book) + 1
+
+				chap_num = int(words[n]) + copy * real_book_lengths[book]
+				if chap_num <= scaled_book_lengths[book]:
+					f.write(' '.join(words[:n] + [str(chap_num)] + words[n + 1:]) + '\n')
+
+	# Episodes - tile whole seasons
+
+	episodes_header, episode_rows = read_csv(episodes_filename)
+	num_real_seasons = max([int(row[0]) for row in episode_rows])
+	num_episodes = max(1, round(len(episode_rows) * factor))
+
+	out_episode_rows = []
+	episode_keys = {}  # episode index -> (season, number in season)
+	for idx in range(num_episodes):
+		copy, real_idx = divmod(idx, len(episode_rows))
+		season, _, num_in_season, name = episode_rows[real_idx]
+		season = int(season) + copy * num_real_seasons
+		# Names are quoted in the CSV, and the parser strips the quotes
+		name = name[:-1] + copy_suffix(copy) + name[-1]
+		out_episode_rows.append([str(season), str(idx + 1), num_in_season, name])
+		episode_keys[idx] = (season, int(num_in_season))
+
+	write_csv(os.path.join(out_dir, 'episodes.csv'), episodes_header, out_episode_rows)
+
+	# Connections - tile across both episode copies and chapter copies
+
+	episode_idx = {
+		(int(row[0]), int(row[2])): idx for idx, row in enumerate(episode_rows)}
+	chapter_idx = {
+		(book_num, row[2]): idx
+		for book_num, book_name in enumerate(book_names, 1) for idx, row in enumerate(real_chapters[book_name])}
+
+	connections_header, connection_rows = read_csv(connections_filename)
+
+	out_connection_rows = []
+	for row in connection_rows:
+		if not row[0].isdigit():
+			continue
+
+		seas_num, ep_num_in_season, book_num, chap_name = row[:4]
+		book_num = int(book_num)
+
+		real_ep = episode_idx.get((int(seas_num), int(ep_num_in_season)))
+		real_chap = chapter_idx.get((book_num, chap_name))
+
+		# Keep connections the real data skips or warns about as-is, so the same code paths get exercised
+		if real_ep is None or real_chap is None:
+			out_connection_rows.append(row)
+			continue
+
+		book_name = book_names[book_num - 1]
+
+		for ep in range(real_ep, num_episodes, len(episode_rows)):
+			for chap in range(real_chap, num_chapters[book_name], len(real_chapters[book_name])):
+				season, num_in_season = episode_keys[ep]
+				out_connection_rows.append(
+					[str(season), str(num_in_season), str(book_num), chapter_names[(book_num, chap)]] + row[4:])
+
+	write_csv(os.path.join(out_dir, 'connections.csv'), connections_header, out_connection_rows)
+
+	for filename in _template_filenames:
+		shutil.copyfile(os.path.join(base_dir, filename), os.path.join(out_dir, filename))
+
+	return {
+		'chapters': len(out_chapter_rows),
+		'episodes': len(out_episode_rows),
+		'connections': len(out_connection_rows),
+		'input_rows': len(book_rows) + len(out_chapter_rows) + len(out_episode_rows) + len(out_connection_rows),
+	}
+
+
+def run_quietly(func: Callable, *args, **kwargs):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return func(*args, **kwargs)
+
+
+def time_phase(func: Callable, num_runs: int, measure_memory: bool) -> Tuple[float, int]:
+	"""
+	:param func: function to time
+	:param num_runs:
+	:param measure_memory: if True, will do an extra run with tracemalloc (separately, as it slows things down)
+	:return: (best time in seconds, peak traced memory in bytes - or 0 if not measure_memory)
+	"""
+
+	times = []
+	for _ in range(num_runs):
+		start = time.perf_counter()
+		run_quietly(func)
+		times.append(time.perf_counter() - start)
+
+	peak = 0
+	if measure_memory:
+		tracemalloc.start()
+		run_quietly(func)
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+	return min(times), peak
+
+
+def get_output_size(dirs: List[str]) -> int:
+	return sum([
+		os.path.getsize(os.path.join(dir, filename))
+		for dir in dirs for filename in os.listdir(dir) if filename.endswith('.html')])
+
+
+def benchmark_scale(base_dir: str, work_dir: str, scale: float, num_runs: int, measure_memory: bool) -> Dict:
+
+	input_dir = os.path.join(work_dir, 'input')
+	output_dir = os.path.join(work_dir, 'output')
+	output_print_dir = os.path.join(work_dir, 'output-print')
+	os.makedirs(output_dir, exist_ok=True)
+	os.makedirs(output_print_dir, exist_ok=True)
+
+	counts = generate_dataset(base_dir, input_dir, scale)
+
+	input_bytes = sum([os.path.getsize(filename) for filename in parsing.get_input_filenames(input_dir)])
+
+	db = run_quietly(parsing.do_parsing, input_dir)
+
+	# Combined books get their own columns in the table too, so count every book
+	num_episodes = sum([len(season.episodes) for season in db.seasons])
+	num_columns = sum([len(book.chapters) + 1 for book in db.books])  # +1 for each book's summary column
+	num_cells = num_episodes * num_columns
+
+	results = {
+		'scale': scale,
+		'counts': dict(counts, cells=num_cells, input_bytes=input_bytes),
+		'phases': {},
+	}
+
+	phases = [
+		('parse', lambda: parsing.do_parsing(input_dir)),
+		('sanity_check', db.sanity_check),
+		('print', lambda: printing.do_printing(
+			db, input_dir=input_dir, output_dir=output_dir, output_print_dir=output_print_dir)),
+	]
+
+	for name, func in phases:
+		seconds, peak = time_phase(func, num_runs, measure_memory)
+		phase = {'seconds': seconds, 'peak_bytes': peak}
+
+		if name == 'parse':
+			phase['rows_per_s'] = counts['input_rows'] / seconds
+			phase['mb_per_s_read'] = input_bytes / seconds / 1e6
+		elif name == 'sanity_check':
+			phase['connections_per_s'] = counts['connections'] / seconds
+		elif name == 'print':
+			output_bytes = get_output_size([output_dir, output_print_dir])
+			phase['output_bytes'] = output_bytes
+			phase['cells_per_s'] = num_cells / seconds
+			phase['mb_per_s_written'] = output_bytes / seconds / 1e6
+
+		results['phases'][name] = phase
+
+	return results
+
+
+def get_commit() -> str:
+	try:
+		return subprocess.check_output(
+			['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return ''
+
+
+def print_results(results: Dict, previous: Dict=None):
+	"""Print results table, with ratio of time vs previous results (for the same scale) if given"""
+
+	previous_by_scale = {}
+	if previous is not None:
+		previous_by_scale = {result['scale']: result for result in previous['results']}
+
+	print('%8s %-13s %10s %14s %18s %12s %10s' % (
+		'Scale', 'Phase', 'Time (ms)', 'Peak mem (MB)', 'Throughput', 'Written', 'vs prev'))
+
+	for result in results['results']:
+		for name, phase in result['phases'].items():
+
+			if 'rows_per_s' in phase:
+				throughput = '%.0f rows/s' % phase['rows_per_s']
+			elif 'cells_per_s' in phase:
+				throughput = '%.0f cells/s' % phase['cells_per_s']
+			else:
+				throughput = '%.0f conns/s' % phase['connections_per_s']
+
+			written = '%.1f MB/s' % phase['mb_per_s_written'] if 'mb_per_s_written' in phase else ''
+
+			vs_prev = ''
+			prev_result = previous_by_scale.get(result['scale'])
+			if prev_result is not None and name in prev_result['phases']:
+				vs_prev = '%.2fx' % (phase['seconds'] / prev_result['phases'][name]['seconds'])
+
+			print('%8g %-13s %10.1f %14.1f %18s %12s %10s' % (
+				result['scale'], name, 1000.0 * phase['seconds'], phase['peak_bytes'] / 1e6, throughput, written, vs_prev))
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description='Benchmark parsing, sanity checking & printing on synthetic data, scaled up from the real data')
+	parser.add_argument('-i', '--input', default='input', help='Input directory to scale up')
+	parser.add_argument(
+		'-s', '--scales', type=float, nargs='+', default=[1, 10, 100],
+		help='Scales to benchmark - multiples of the number of table cells & connections in the real data')
+	parser.add_argument('-n', '--num-runs', type=int, default=3, help='Number of runs per phase (best is reported)')
+	parser.add_argument('--no-memory', action='store_true', help="Don't measure peak memory (saves a run per phase)")
+	parser.add_argument('-o', '--output', help='Write results to this JSON file')
+	parser.add_argument('-c', '--compare', help='Compare times against results from a previous run (JSON file)')
+	parser.add_argument('--keep', help='Generate synthetic data in this directory, and keep it afterwards')
+	args = parser.parse_args()
+
+	previous = None
+	if args.compare:
+		with open(args.compare) as f:
+			previous = json.load(f)
+
+	results = {
+		'commit': get_commit(),
+		'date': datetime.datetime.now().isoformat(timespec='seconds'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'num_runs': args.num_runs,
+		'results': [],
+	}
+
+	for scale in args.scales:
+		print('Benchmarking scale %g' % scale)
+
+		if args.keep:
+			work_dir = os.path.join(args.keep, 'scale-%g' % scale)
+			results['results'].append(
+				benchmark_scale(args.input, work_dir, scale, args.num_runs, not args.no_memory))
+		else:
+			with tempfile.TemporaryDirectory() as work_dir:
+				results['results'].append(
+					benchmark_scale(args.input, work_dir, scale, args.num_runs, not args.no_memory))
+
+	print('')
+	print_results(results, previous)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent='\t')
+		print('')
+		print('Results written to %s' % args.output)
+
+
+if __name__ == "__main__":
+	main()
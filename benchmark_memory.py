@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script measures the memory footprint of the parsed DB, to compare between revisions.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+from book_show_types import *
+import parsing
+
+
+def object_size(obj) -> int:
+	"""Size of object itself, plus its __dict__ if it has one (but not the objects it refers to)"""
+	size = sys.getsizeof(obj)
+	if hasattr(obj, '__dict__'):
+		size += sys.getsizeof(obj.__dict__)
+	return size
+
+
+def parse_quietly(input_dir: str) -> DB:
+	with contextlib.redirect_stdout(io.StringIO()):
+		return parsing.do_parsing(input_dir)
+
+
+def get_all_objects(db: DB) -> dict:
+	"""
+	:return: dict of type name -> list of all objects of that type in db
+	"""
+
+	chapters = [chapter for book in db.books if not book.is_combined() for chapter in book.chapters]
+	episodes = [episode for season in db.seasons for episode in season.episodes]
+	connections = [connection for episode in episodes for connection in episode.book_connections]
+
+	return {
+		'Book': db.books,
+		'Chapter': chapters,
+		'Season': db.seasons,
+		'Episode': episodes,
+		'Connection': connections,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Measure memory footprint and parse time of the DB')
+	parser.add_argument('-i', '--input', default='input', help='Input directory')
+	parser.add_argument('-n', '--num-runs', type=int, default=10, help='Number of parse runs to time')
+	args = parser.parse_args()
+
+	# Total footprint
+
+	tracemalloc.start()
+	db = parse_quietly(args.input)
+	db_size, db_peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	# Per-object sizes
+
+	print('%-12s %10s %14s %14s' % ('Type', 'Count', 'Bytes/object', 'Total bytes'))
+	total = 0
+	for type_name, objects in get_all_objects(db).items():
+		sizes = [object_size(obj) for obj in objects]
+		total += sum(sizes)
+		print('%-12s %10i %14.1f %14i' % (
+			type_name, len(objects), (sum(sizes) / len(sizes)) if sizes else 0.0, sum(sizes)))
+	print('%-12s %10s %14s %14i' % ('All', '', '', total))
+
+	print('')
+	print('DB footprint (tracemalloc): %i bytes, peak during parsing %i bytes' % (db_size, db_peak))
+
+	# Parse time
+
+	times = []
+	for _ in range(args.num_runs):
+		start = time.perf_counter()
+		parse_quietly(args.input)
+		times.append(time.perf_counter() - start)
+
+	print('Parse time: best %.2f ms, mean %.2f ms (%i runs)' % (
+		1000.0 * min(times), 1000.0 * sum(times) / len(times), len(times)))
+
+
+if __name__ == "__main__":
+	main()
@@ -29,15 +29,47 @@ A note from the author:
 """
 
 
-from typing import List
-from utils import find_unique
-from dataclasses import dataclass, field
+from typing import List, Optional
+import collections
+from utils import add_to_index, find_in_index
+from dataclasses import dataclass, field, fields
 
 
 # Technically it's not 100% correct to set frozen=True, as some of these members (the lists) are mutable and we will be
 # modifiing them later. I'm not sure if that's non-pythonic, but at least it protects against changing the other fields
 
 
+def slotted(cls):
+	"""Class decorator to recreate a frozen dataclass with __slots__, so instances don't each carry a __dict__
+
+	This is what dataclass(slots=True) does, but that requires Python 3.10+. Must be applied on top of @dataclass.
+	"""
+
+	field_names = tuple(f.name for f in fields(cls))
+
+	cls_dict = dict(cls.__dict__)
+	for name in field_names + ('__dict__', '__weakref__'):
+		cls_dict.pop(name, None)
+	cls_dict['__slots__'] = field_names
+
+	# Default pickling of slots sets attributes normally, which frozen dataclasses don't allow
+
+	def __getstate__(self):
+		return [getattr(self, name) for name in field_names]
+
+	def __setstate__(self, state):
+		for name, value in zip(field_names, state):
+			object.__setattr__(self, name, value)
+
+	cls_dict['__getstate__'] = __getstate__
+	cls_dict['__setstate__'] = __setstate__
+
+	new_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+	new_cls.__qualname__ = cls.__qualname__
+	return new_cls
+
+
+@slotted
 @dataclass(frozen=True)
 class Book:
 	number: int
@@ -70,6 +102,7 @@ class Book:
 			)
 
 
+@slotted
 @dataclass(frozen=True)
 class Chapter:
 	number: int
@@ -87,6 +120,7 @@ class Chapter:
 			self.number, self.book.name, self.number_in_book, self.name, self.pov, str(self.occurred))
 
 
+@slotted
 @dataclass(frozen=True)
 class Season:
 	number: int
@@ -99,6 +133,7 @@ class Season:
 		return 'Season(%i, %i episodes)' % (self.number, len(self.episodes))
 
 
+@slotted
 @dataclass(frozen=True)
 class Episode:
 	number: int
@@ -114,6 +149,7 @@ class Episode:
 		return 'Episode(%s, %i book connections)' % (str(self), len(self.book_connections))
 
 
+@slotted
 @dataclass(frozen=True)
 class Connection:
 	episode: Episode
@@ -130,14 +166,225 @@ class Connection:
 			self.episode.number, self.chapter.number, str(self.strength), str(self.major), self.notes)
 
 
+@dataclass
+class SanityViolation:
+	source: str  # Input file & the fields that identify the row in it
+	message: str
+
+	def __str__(self):
+		return '%s: %s' % (self.source, self.message)
+
+
+class SanityCheckError(ValueError):
+	def __init__(self, violations: List[SanityViolation]):
+		self.violations = violations
+		super().__init__('%i sanity check violation%s:\n%s' % (
+			len(violations), '' if len(violations) == 1 else 's', '\n'.join([str(v) for v in violations])))
+
+
+# Items don't keep the line number they were parsed from, so violations identify rows by the fields in them instead
+
+def get_book_source(book: Book) -> str:
+	return 'books.csv: "%s"' % book.name
+
+
+def get_chapter_source(chapter: Chapter, filename='chapters.csv') -> str:
+	return '%s: %s, "%s"' % (filename, chapter.book.name, chapter.name)
+
+
+def get_episode_source(episode: Episode) -> str:
+	return 'episodes.csv: %ix%02i "%s"' % (episode.season.number, episode.number_in_season, episode.name)
+
+
+def get_connection_source(episode: Episode, chapter: Optional[Chapter]) -> str:
+	if chapter is None:
+		return 'connections.csv: %ix%02i, no chapter' % (episode.season.number, episode.number_in_season)
+	return 'connections.csv: %ix%02i, book %i, "%s"' % (
+		episode.season.number, episode.number_in_season, chapter.book.number, chapter.name)
+
+
 class DB:
 	def __init__(self):
 		self.books = []
 		self.seasons = []
 
+		# Optional columnar.ColumnarConnections, if built after parsing
+		self.columnar = None
+
+		# Lookup indexes, so that finding items doesn't require scanning lists
+		# These are only kept up to date if items are added through the add_* functions below
+		self._books_by_number = {}
+		self._books_by_name = {}
+		self._chapters_by_book_and_name = {}
+		self._chapters_by_number = {}
+		self._seasons_by_number = {}
+		self._episodes_by_season_and_number = {}
+		self._episodes_by_number = {}
+
+		# Reverse index of connections, so chapter queries don't require scanning every episode's connections
+		# Only kept up to date if connections are added through add_connection()
+		self._connections_by_chapter_number = {}  # chapter number -> list of connections, in the order they were added
+		self._strongest_connection_by_chapter_number = {}  # chapter number -> connection
+		self._first_connection_by_chapter_number = {}  # chapter number -> connection
+		self._unadapted_chapters_by_book_number = {}  # real book number -> chapter number -> chapter
+
+	def add_book(self, book: Book, position: Optional[int]=None):
+		"""Add book (and any chapters already in it) to the DB
+
+		:param book:
+		:param position: position in self.books to insert book at; if None, will append
+		"""
+
+		if position is None:
+			self.books.append(book)
+		else:
+			self.books.insert(position, book)
+
+		add_to_index(self._books_by_number, book.number, book)
+		add_to_index(self._books_by_name, book.name, book)
+
+		for chapter in book.chapters:
+			self._index_chapter(book, chapter)
+
+	def add_chapter(self, book: Book, chapter: Chapter):
+		"""
+		:param book: Note that this may not match chapter.book for combined books
+		:param chapter:
+		"""
+		book.chapters.append(chapter)
+		self._index_chapter(book, chapter)
+
+	def _index_chapter(self, book: Book, chapter: Chapter):
+		add_to_index(self._chapters_by_book_and_name, (book.number, chapter.name), chapter)
+
+		# Combined books reference the same chapters as the real books, so only index global number once
+		if book is chapter.book:
+			add_to_index(self._chapters_by_number, chapter.number, chapter)
+
+			if chapter.number not in self._connections_by_chapter_number:
+				self._unadapted_chapters_by_book_number.setdefault(book.number, {})[chapter.number] = chapter
+
+	def add_season(self, season: Season):
+		self.seasons.append(season)
+		add_to_index(self._seasons_by_number, season.number, season)
+
+		for episode in season.episodes:
+			self._index_episode(season, episode)
+
+	def add_episode(self, season: Season, episode: Episode):
+		season.episodes.append(episode)
+		self._index_episode(season, episode)
+
+	def _index_episode(self, season: Season, episode: Episode):
+		add_to_index(self._episodes_by_season_and_number, (season.number, episode.number_in_season), episode)
+		add_to_index(self._episodes_by_number, episode.number, episode)
+
+	def add_connection(self, connection: Connection):
+		"""Add connection to its episode, and to the reverse index of connections by chapter"""
+
+		connection.episode.book_connections.append(connection)
+
+		chapter_number = connection.chapter.number
+
+		connections = self._connections_by_chapter_number.setdefault(chapter_number, [])
+		connections.append(connection)
+
+		if len(connections) == 1:
+			self._unadapted_chapters_by_book_number.get(connection.chapter.book.number, {}).pop(chapter_number, None)
+			self._strongest_connection_by_chapter_number[chapter_number] = connection
+			self._first_connection_by_chapter_number[chapter_number] = connection
+			return
+
+		# Ties go to the earliest episode
+
+		strongest = self._strongest_connection_by_chapter_number[chapter_number]
+		if (connection.strength, -connection.episode.number) > (strongest.strength, -strongest.episode.number):
+			self._strongest_connection_by_chapter_number[chapter_number] = connection
+
+		first = self._first_connection_by_chapter_number[chapter_number]
+		if connection.episode.number < first.episode.number:
+			self._first_connection_by_chapter_number[chapter_number] = connection
+
+	def find_book(self, book_num, throw_if_not_found=True):
+		return find_in_index(self._books_by_number, book_num, throw_if_not_found=throw_if_not_found)
+
+	def find_book_by_name(self, book_name, throw_if_not_found=True):
+		return find_in_index(self._books_by_name, book_name, throw_if_not_found=throw_if_not_found)
+
 	def find_chapter(self, chap_name, book_num):
-		book = find_unique(self.books, lambda book: book.number == book_num)
-		return find_unique(book.chapters, lambda chapter: chapter.name == chap_name)
+		# Look up book first, so that a missing book fails the same way as a missing chapter name
+		self.find_book(book_num)
+		return find_in_index(self._chapters_by_book_and_name, (book_num, chap_name))
+
+	def find_chapter_by_number(self, chap_num, throw_if_not_found=True):
+		return find_in_index(self._chapters_by_number, chap_num, throw_if_not_found=throw_if_not_found)
+
+	def find_season(self, season_num, throw_if_not_found=True):
+		return find_in_index(self._seasons_by_number, season_num, throw_if_not_found=throw_if_not_found)
+
+	def find_episode(self, season_num, ep_num_in_season, throw_if_not_found=True):
+		# Same as with find_chapter, check season exists first
+		if self.find_season(season_num, throw_if_not_found=throw_if_not_found) is None:
+			return None
+		return find_in_index(
+			self._episodes_by_season_and_number, (season_num, ep_num_in_season), throw_if_not_found=throw_if_not_found)
+
+	def find_episode_by_number(self, ep_num, throw_if_not_found=True):
+		return find_in_index(self._episodes_by_number, ep_num, throw_if_not_found=throw_if_not_found)
+
+	# Chapter queries, using the reverse index of connections
+	# These take time proportional to the size of the result, not the number of episodes or connections
+
+	def get_chapter_connections(self, chapter: Chapter) -> List[Connection]:
+		"""
+		:return: all connections to chapter, in the order they were added; empty list if none. Do not modify.
+		"""
+		return self._connections_by_chapter_number.get(chapter.number, [])
+
+	def get_chapter_episodes(self, chapter: Chapter) -> List[Episode]:
+		"""
+		:return: episodes with at least 1 connection to chapter, in the order they were first connected
+		"""
+		episodes = {}
+		for connection in self.get_chapter_connections(chapter):
+			episodes.setdefault(connection.episode.number, connection.episode)
+		return list(episodes.values())
+
+	def get_strongest_episode(self, chapter: Chapter) -> Optional[Episode]:
+		"""
+		:return: episode with the strongest connection to chapter (earliest if tied); None if chapter is unadapted
+		"""
+		connection = self._strongest_connection_by_chapter_number.get(chapter.number)
+		return connection.episode if connection is not None else None
+
+	def get_first_adapted_episode(self, chapter: Chapter) -> Optional[Episode]:
+		"""
+		:return: earliest episode with any connection to chapter; None if chapter is unadapted
+		"""
+		connection = self._first_connection_by_chapter_number.get(chapter.number)
+		return connection.episode if connection is not None else None
+
+	def is_chapter_adapted(self, chapter: Chapter) -> bool:
+		return chapter.number in self._connections_by_chapter_number
+
+	def get_unadapted_chapters(self, book: Optional[Book]=None) -> List[Chapter]:
+		"""
+		:param book: book to get chapters from (may be a combined book, in which case chapters are in order of its
+		member books, not combined order); if None, will get chapters from all books
+		:return: chapters with no connections to any episode
+		"""
+
+		if book is None:
+			books = [book for book in self.books if not book.is_combined()]
+		elif book.is_combined():
+			books = book.combined_books
+		else:
+			books = [book]
+
+		return [
+			chapter
+			for book in books
+			for chapter in self._unadapted_chapters_by_book_number.get(book.number, {}).values()]
 
 	# There is some duplicate data in here for convenience sake. For example:
 	#   * Chapter doesn't need reference back to book, since that could be determined from book list
@@ -148,34 +395,269 @@ class DB:
 	# These sanity checks ensure this duplicate data is all correct
 
 	def sanity_check(self):
+		"""
+		:raises: SanityCheckError listing every violation, if there are any (see find_sanity_violations)
+		"""
+		violations = self.find_sanity_violations()
+		if violations:
+			raise SanityCheckError(violations)
+
+	def find_sanity_violations(self) -> List[SanityViolation]:
+		"""Check all of the above in a single pass over books, chapters, seasons, episodes & connections, plus that
+		combined books contain every chapter of their member books exactly once, and that every connection has a
+		chapter which is in the DB
+
+		If DB has columnar connections, connection values (e.g. strength) are checked vectorized on those instead.
+
+		:return: every violation found, in the order of the input files
+		"""
+
+		violations = []
+
+		# Only work out source when there is a violation, as it's relatively slow
+
+		def violation(source: str, message: str):
+			violations.append(SanityViolation(source, message))
+
+		def chapter_violation(chapter: Chapter, message: str):
+			violation(get_chapter_source(chapter), message)
+
+		def episode_violation(episode: Episode, message: str):
+			violation(get_episode_source(episode), message)
+
+		def connection_violation(episode: Episode, connection: Connection, message: str):
+			violation(get_connection_source(episode, connection.chapter), message)
 
 		# Books & chapters
 
-		real_books = [book for book in self.books if not book.is_combined()]
+		chapter_ids = set()  # ids of all chapters in real books, for checking connections & combined books
+		combined_books = []
+
+		book_position = 0
+		chapter_position = 0
+
+		for book in self.books:
+			if book.is_combined():
+				combined_books.append(book)
+				continue
+
+			book_position += 1
+			if book.number != book_position:
+				violation(get_book_source(book), 'Book number %i does not match position in book list (%i)' % (
+					book.number, book_position))
 
-		if not all([book.number == idx + 1 for idx, book in enumerate(real_books)]):
-			raise ValueError('Book list is not sorted & complete')
+			for idx, chapter in enumerate(book.chapters):
+				chapter_position += 1
 
-		for book in real_books:
-			if not all([chapter.number_in_book == idx + 1 for idx, chapter in enumerate(book.chapters)]):
-				raise ValueError('Chapter number in book does not match position in book list')
+				if chapter.number_in_book != idx + 1:
+					chapter_violation(chapter, 'Chapter number in book %i does not match position in book (%i)' % (
+						chapter.number_in_book, idx + 1))
 
-			if not all([chapter.book is book for chapter in book.chapters]):
-				raise ValueError("Chapter's book reference does not match book it is in!")
+				if chapter.number != chapter_position:
+					chapter_violation(chapter, 'Chapter number %i does not match position in all books (%i)' % (
+						chapter.number, chapter_position))
 
-		# Seasons & episodes
+				if chapter.book is not book:
+					chapter_violation(chapter, "Chapter's book reference does not match book it is in (%s)" % book.name)
 
-		if not all([season.number == idx + 1 for idx, season in enumerate(self.seasons)]):
-			raise ValueError('Season list is not sorted & complete')
+				if id(chapter) in chapter_ids:
+					chapter_violation(chapter, 'Chapter is in more than 1 book')
 
-		for season in self.seasons:
-			if not all([episode.number_in_season == idx + 1 for idx, episode in enumerate(season.episodes)]):
-				raise ValueError('Episode number in season does not match position in season list')
+				chapter_ids.add(id(chapter))
 
-			if not all([episode.season is season for episode in season.episodes]):
-				raise ValueError("Episodes's season reference does not match season it is in!")
+		# Combined books
 
+		for book in combined_books:
+			counts = collections.Counter([id(chapter) for chapter in book.chapters])
+
+			for member in book.combined_books:
+				for chapter in member.chapters:
+					count = counts.pop(id(chapter), 0)
+					if count != 1:
+						violation(
+							get_chapter_source(chapter, filename='combined.txt'),
+							'Chapter appears %i times in %s (expected once)' % (count, book.abbreviation))
+
+			for chapter in book.chapters:
+				if id(chapter) in counts:
+					del counts[id(chapter)]
+					violation(
+						get_chapter_source(chapter, filename='combined.txt'),
+						'Chapter is in %s, but not in any of the books it combines' % book.abbreviation)
+
+		# Seasons, episodes & connections
+
+		check_connection_values = self.columnar is None
+		columnar_violations = {} if check_connection_values else self.columnar.find_sanity_violations()
+
+		episode_position = 0
+
+		for season_idx, season in enumerate(self.seasons):
+			if season.number != season_idx + 1:
+				violation('episodes.csv: season %i' % season.number,
+					'Season number does not match position in season list (%i)' % (season_idx + 1))
+
+			for idx, episode in enumerate(season.episodes):
+				episode_position += 1
+
+				if episode.number_in_season != idx + 1:
+					episode_violation(episode, 'Episode number in season %i does not match position in season (%i)' % (
+						episode.number_in_season, idx + 1))
+
+				if episode.number != episode_position:
+					episode_violation(episode, 'Episode number %i does not match position in all seasons (%i)' % (
+						episode.number, episode_position))
+
+				if episode.season is not season:
+					episode_violation(episode, "Episode's season reference does not match season it is in (%i)" % (
+						season.number))
+
+				for connection_position, connection in enumerate(episode.book_connections):
+					if connection.episode is not episode:
+						connection_violation(
+							episode, connection, "Connection's episode reference does not match episode it is in")
+
+					# Columnar connections leave out connections without a valid chapter, so check values of these here
+					chapter_is_valid = False
+					if connection.chapter is None:
+						connection_violation(episode, connection, 'Connection has no chapter')
+					elif id(connection.chapter) not in chapter_ids:
+						connection_violation(episode, connection, 'Connection chapter is not in any book')
+					else:
+						chapter_is_valid = True
+
+					if (check_connection_values or not chapter_is_valid) and connection.strength not in (0, 1):
+						connection_violation(
+							episode, connection, 'Connection strength %s is not 0 or 1' % connection.strength)
+
+					columnar_violation = columnar_violations.get((episode_position - 1, connection_position))
+					if columnar_violation is not None:
+						violations.append(columnar_violation)
+
+		return violations
+
+
+def _test_chapter_queries():
+	"""Inline unit tests of DB chapter queries, on a small DB with a combined book"""
+
+	db = DB()
+
+	book1 = Book(number=1, name='Book 1', abbreviation='B1')
+	book2 = Book(number=2, name='Book 2', abbreviation='B2')
+	combined_book = Book(number=45, name='Books 1 & 2', abbreviation='B12', combined_books=[book1, book2])
+	db.add_book(book1)
+	db.add_book(book2)
+	db.add_book(combined_book)
+
+	ch1 = Chapter(number=1, book=book1, number_in_book=1, name='A', pov='', occurred=True)
+	ch2 = Chapter(number=2, book=book1, number_in_book=2, name='B', pov='', occurred=True)
+	ch3 = Chapter(number=3, book=book2, number_in_book=1, name='C', pov='', occurred=True)
+	ch4 = Chapter(number=4, book=book2, number_in_book=2, name='D', pov='', occurred=True)
+	for chapter in [ch1, ch2, ch3, ch4]:
+		db.add_chapter(chapter.book, chapter)
+
+	# Combined order differs from book order
+	for chapter in [ch3, ch1, ch4, ch2]:
+		db.add_chapter(combined_book, chapter)
+
+	season = Season(number=1)
+	db.add_season(season)
+	ep1, ep2, ep3 = [Episode(number=n, number_in_season=n, season=season, name='Ep %i' % n) for n in [1, 2, 3]]
+	for episode in [ep1, ep2, ep3]:
+		db.add_episode(season, episode)
+
+	# Connections to ch1 are added out of episode order, with a tie for strongest between ep3 and ep1
+	c1 = Connection(episode=ep2, chapter=ch1, strength=2, major=False, notes='')
+	c2 = Connection(episode=ep3, chapter=ch1, strength=3, major=False, notes='')
+	c3 = Connection(episode=ep1, chapter=ch1, strength=3, major=False, notes='')
+	c4 = Connection(episode=ep2, chapter=ch1, strength=1, major=False, notes='')
+	c5 = Connection(episode=ep3, chapter=ch3, strength=1, major=False, notes='')
+	for connection in [c1, c2, c3, c4, c5]:
+		db.add_connection(connection)
+
+	assert db.get_chapter_connections(ch1) == [c1, c2, c3, c4]
+	assert db.get_chapter_connections(ch2) == []
+	assert db.get_chapter_episodes(ch1) == [ep2, ep3, ep1]
+	assert db.get_chapter_episodes(ch2) == []
+
+	assert db.get_strongest_episode(ch1) is ep1
+	assert db.get_strongest_episode(ch3) is ep3
+	assert db.get_strongest_episode(ch2) is None
+
+	assert db.get_first_adapted_episode(ch1) is ep1
+	assert db.get_first_adapted_episode(ch2) is None
+
+	assert db.is_chapter_adapted(ch1)
+	assert db.is_chapter_adapted(ch3)
+	assert not db.is_chapter_adapted(ch2)
+	assert not db.is_chapter_adapted(ch4)
+
+	# Chapters of the combined book are the same chapters as in the real books, so are only counted once
+	assert db.find_chapter('A', 45) is ch1
+	assert db.get_strongest_episode(db.find_chapter('A', 45)) is ep1
+	assert db.get_unadapted_chapters() == [ch2, ch4]
+	assert db.get_unadapted_chapters(book1) == [ch2]
+	assert db.get_unadapted_chapters(book2) == [ch4]
+	assert db.get_unadapted_chapters(combined_book) == [ch2, ch4]
+
+	# Adapting a chapter removes it from unadapted chapters
+	db.add_connection(Connection(episode=ep1, chapter=ch4, strength=1, major=False, notes=''))
+	assert db.get_unadapted_chapters(combined_book) == [ch2]
+	assert db.get_first_adapted_episode(ch4) is ep1
+
+
+# Inline unit tests
+_test_chapter_queries()
+
+
+class ConnectionIndex:
+	"""Sparse episode x chapter lookup of connections
+
+	Built once from a fully parsed DB, so the table renderer doesn't have to scan each episode's connection list for
+	every cell. Does not update if connections are added after it is built.
+	"""
+
+	def __init__(self, db: DB):
+		# episode number -> chapter number -> list of connections (in the order they were parsed)
+		self._connections = {}
+
+		# (episode number, book number) -> strongest connection strength, for book summary cells
+		# Includes combined books, keyed by the combined book's number
+		# If DB has columnar connections, these are calculated from those instead
+		self._book_strengths = db.columnar.get_book_strengths_dict() if db.columnar is not None else {}
+
+		combined_book_nums = {}  # real book number -> numbers of combined books it is part of
+		for book in db.books:
+			for real_book in book.combined_books:
+				combined_book_nums.setdefault(real_book.number, []).append(book.number)
+
+		for season in db.seasons:
 			for episode in season.episodes:
+				episode_connections = self._connections.setdefault(episode.number, {})
+
 				for connection in episode.book_connections:
-					if not connection.episode is episode:
-						raise ValueError("Connection's episode reference does not match episode it is in!")
+					episode_connections.setdefault(connection.chapter.number, []).append(connection)
+
+					if db.columnar is not None:
+						continue
+
+					book_num = connection.chapter.book.number
+					for key_book_num in [book_num] + combined_book_nums.get(book_num, []):
+						key = (episode.number, key_book_num)
+						strength = self._book_strengths.get(key)
+						if strength is None or connection.strength > strength:
+							self._book_strengths[key] = connection.strength
+
+	def get_connections(self, episode: Episode, chapter: Chapter) -> List[Connection]:
+		"""
+		:return: all connections between episode and chapter; empty list if none
+		"""
+		return self._connections.get(episode.number, {}).get(chapter.number, [])
+
+	def get_book_strength(self, episode: Episode, book: Book) -> Optional[int]:
+		"""
+		:param episode:
+		:param book: may be a combined book
+		:return: strongest connection strength between episode and any chapter in book; None if no connections
+		"""
+		return self._book_strengths.get((episode.number, book.number))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+import argparse
+import contextlib
+import io
+import os.path
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Set, Tuple
+
+from book_show_types import *
+import parsing
+import printing
+
+
+# Classes that got.js shows & hides
+_js_class_re = re.compile(r'^b\d+c?$')
+
+_css_rule_re = re.compile(r'([^{}]+)\{([^{}]*)\}')
+
+_row_rule_re = re.compile(r'^#maintable\.compact tr\.(\w+) > td$')
+_column_rule_re = re.compile(r'^#maintable\.compact td:nth-last-child\((\d+)\)$')
+_hide_rule_re = re.compile(r'^#maintable\.h(\w+) td:nth-last-child\(n\+(\d+)\):nth-last-child\(-n\+(\d+)\)$')
+
+
+class TableCellParser(HTMLParser):
+	"""Collects classes & contents of the body cells of #maintable, and any <style> contents"""
+
+	def __init__(self):
+		super().__init__()
+		self.table_classes = set()
+		self.rows = []  # list of (tr classes, list of (td classes, list of tags in td))
+		self.style = ''
+		self._in_table = False
+		self._in_body = False
+		self._in_style = False
+		self._cell = None
+
+	def handle_starttag(self, tag, attrs):
+		attrs = dict(attrs)
+		classes = set((attrs.get('class') or '').split())
+
+		if tag == 'style':
+			self._in_style = True
+		elif tag == 'table':
+			self._in_table = attrs.get('id') == 'maintable'
+			if self._in_table:
+				self.table_classes = classes
+		elif not self._in_table:
+			pass
+		elif tag == 'tbody':
+			self._in_body = True
+		elif not self._in_body:
+			pass
+		elif tag == 'tr':
+			self.rows.append((classes, []))
+			self._cell = None
+		elif tag == 'td':
+			self._cell = []
+			self.rows[-1][1].append((classes, self._cell))
+		elif tag == 'th':
+			self._cell = None
+		elif self._cell is not None:
+			self._cell.append((tag, sorted(attrs.items())))
+
+	def handle_endtag(self, tag):
+		if tag == 'style':
+			self._in_style = False
+		elif tag == 'table':
+			self._in_table = self._in_body = False
+		elif tag in ('td', 'th', 'tr'):
+			self._cell = None
+
+	def handle_data(self, data):
+		if self._in_style:
+			self.style += data
+
+
+def normalize_declarations(declarations: str) -> str:
+	return ''.join(declarations.split())
+
+
+def parse_table_css(filename: str) -> Tuple[Dict[str, str], Set[str]]:
+	"""
+	:return: (dict of normalized declarations -> cell class, set of classes hidden to begin with)
+	"""
+
+	with open(filename) as f:
+		css = re.sub(r'/\*.*?\*/', '', f.read(), flags=re.DOTALL)
+
+	class_declarations = {}
+	hidden_classes = set()
+
+	for selectors, declarations in _css_rule_re.findall(css):
+		declarations = normalize_declarations(declarations)
+
+		for selector in selectors.split(','):
+			selector = selector.strip()
+
+			match = re.match(r'^td\.(\w+)$', selector)
+			if match:
+				class_declarations[declarations] = match.group(1)
+
+			match = re.match(r'^\.(\w+)$', selector)
+			if match and declarations == 'display:none;':
+				hidden_classes.add(match.group(1))
+
+	return class_declarations, hidden_classes
+
+
+def get_compact_cell_classes(
+		table: TableCellParser,
+		class_declarations: Dict[str, str]) -> Tuple[Dict[str, str], Dict[int, Set[str]], Dict[str, Tuple[int, int]]]:
+	"""Work out which classes compact table's CSS gives each cell
+
+	:return: (dict of row class -> cell class, dict of position from end of row -> cell classes, dict of hide class ->
+	range of positions it hides)
+	"""
+
+	row_classes = {}
+	column_classes = {}
+	hide_ranges = {}
+
+	for selectors, declarations in _css_rule_re.findall(table.style):
+		declarations = normalize_declarations(declarations)
+
+		if declarations not in class_declarations and declarations != 'display:none;':
+			raise ValueError('Compact table CSS does not match any class in table.css: %s' % declarations)
+
+		for selector in selectors.split(','):
+			selector = selector.strip()
+
+			match = _row_rule_re.match(selector)
+			if match:
+				row_classes[match.group(1)] = class_declarations[declarations]
+				continue
+
+			match = _column_rule_re.match(selector)
+			if match:
+				column_classes.setdefault(int(match.group(1)), set()).add(class_declarations[declarations])
+				continue
+
+			match = _hide_rule_re.match(selector)
+			if match and declarations == 'display:none;':
+				hide_ranges[match.group(1)] = (int(match.group(2)), int(match.group(3)))
+				continue
+
+			raise ValueError('Unexpected compact table CSS selector: %s' % selector)
+
+	return row_classes, column_classes, hide_ranges
+
+
+def compare_tables(full: TableCellParser, compact: TableCellParser, table_css_filename: str) -> List[str]:
+	"""
+	:return: list of differences in how cells will look (empty if equivalent)
+	"""
+
+	class_declarations, hidden_classes = parse_table_css(table_css_filename)
+	row_classes, column_classes, hide_ranges = get_compact_cell_classes(compact, class_declarations)
+
+	errors = []
+
+	if len(full.rows) != len(compact.rows):
+		return ['Different number of rows: %i vs %i' % (len(full.rows), len(compact.rows))]
+
+	for row_idx, ((full_tr, full_cells), (compact_tr, compact_cells)) in enumerate(zip(full.rows, compact.rows)):
+
+		if full_tr != compact_tr - set(row_classes.keys()):
+			errors.append('Row %i: different row classes: %s vs %s' % (row_idx, sorted(full_tr), sorted(compact_tr)))
+
+		if len(full_cells) != len(compact_cells):
+			errors.append('Row %i: different number of cells: %i vs %i' % (
+				row_idx, len(full_cells), len(compact_cells)))
+			continue
+
+		compact_row_cell_classes = {row_classes[cls] for cls in compact_tr if cls in row_classes}
+
+		for cell_idx, ((full_classes, full_contents), (compact_classes, compact_contents)) in enumerate(
+				zip(full_cells, compact_cells)):
+
+			position = len(compact_cells) - cell_idx
+
+			full_classes = {
+				cls for cls in full_classes if cls in class_declarations.values() or _js_class_re.match(cls)}
+
+			hide_classes = {cls for cls, (first, last) in hide_ranges.items() if first <= position <= last}
+
+			compact_classes = compact_classes | compact_row_cell_classes | column_classes.get(position, set())
+			compact_classes |= hide_classes
+
+			full_hidden = bool(full_classes & hidden_classes)
+			compact_hidden = any(['h' + cls in compact.table_classes for cls in hide_classes])
+
+			if full_classes != compact_classes:
+				errors.append('Row %i, cell %i: different classes: %s vs %s' % (
+					row_idx, cell_idx, sorted(full_classes), sorted(compact_classes)))
+
+			if full_hidden != compact_hidden:
+				errors.append('Row %i, cell %i: initially %s in full table but not compact' % (
+					row_idx, cell_idx, 'hidden' if full_hidden else 'shown'))
+
+			if full_contents != compact_contents:
+				errors.append('Row %i, cell %i: different contents' % (row_idx, cell_idx))
+
+	return errors
+
+
+def parse_html(html: str) -> Tuple[TableCellParser, float]:
+	"""
+	:return: (parser, time taken to parse in seconds)
+	"""
+	start = time.perf_counter()
+	table = TableCellParser()
+	table.feed(html)
+	table.close()
+	return table, time.perf_counter() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description='Check that compact main table (--compact) will look & behave the same as the full table')
+	parser.add_argument('-i', '--input', default='input', help='Input directory')
+	parser.add_argument('--css', default=os.path.join('output', 'css', 'table.css'), help='Table stylesheet')
+	args = parser.parse_args()
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		db = parsing.do_parsing(args.input)
+
+	members = [member for book in db.books for member in book.combined_books]
+
+	book_sets = [
+		('separate books', [book for book in db.books if not book.is_combined()]),
+		('combined books', [book for book in db.books if not any([book is member for member in members])]),
+		('all books', db.books),
+	]
+
+	num_errors = 0
+
+	for name, books in book_sets:
+		with contextlib.redirect_stdout(io.StringIO()):
+			full_html = printing.render_main_table(db, books=books)
+			compact_html = printing.render_main_table(db, books=books, compact=True)
+
+		full, full_time = parse_html(full_html)
+		compact, compact_time = parse_html(compact_html)
+
+		errors = compare_tables(full, compact, args.css)
+		num_errors += len(errors)
+
+		num_cells = sum([len(cells) for _, cells in full.rows])
+
+		print('%s: %i rows, %i cells: %s' % (name, len(full.rows), num_cells, 'OK' if not errors else 'DIFFERENT'))
+		print('\tfull:    %8i bytes, parsed in %.1f ms' % (len(full_html), 1000.0 * full_time))
+		print('\tcompact: %8i bytes, parsed in %.1f ms (%.1fx smaller)' % (
+			len(compact_html), 1000.0 * compact_time, len(full_html) / len(compact_html)))
+
+		for error in errors[:20]:
+			print('\t' + error)
+		if len(errors) > 20:
+			print('\t...and %i more' % (len(errors) - 20))
+
+	sys.exit(1 if num_errors else 0)
+
+
+if __name__ == "__main__":
+	main()
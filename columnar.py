@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from book_show_types import SanityViolation, get_connection_source
+from typing import Dict, Tuple
+
+# NumPy is optional - only needed if using columnar connections
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+class ColumnarConnections:
+	"""Columnar (NumPy array) copy of all connections in a DB, for vectorized stats
+
+	Each connection is one row across the arrays (except connections without a valid chapter, which are left out).
+	Episodes, chapters & books are referred to by their position in self.episodes, self.chapters & self.books. Built
+	from a fully parsed DB; does not update if connections are added after it is built.
+	"""
+
+	def __init__(self, db):
+
+		if np is None:
+			raise ImportError('NumPy is required for columnar connections')
+
+		self.books = list(db.books)
+		self.seasons = list(db.seasons)
+		self.episodes = [episode for season in db.seasons for episode in season.episodes]
+		self.chapters = [chapter for book in db.books if not book.is_combined() for chapter in book.chapters]
+
+		self._book_idx_by_number = {book.number: idx for idx, book in enumerate(self.books)}
+		season_idx_by_number = {season.number: idx for idx, season in enumerate(self.seasons)}
+		chapter_idx_by_id = {id(chapter): idx for idx, chapter in enumerate(self.chapters)}
+
+		# Per-chapter & per-episode lookups
+
+		self.chapter_book_idx = np.array(
+			[self._book_idx_by_number[chapter.book.number] for chapter in self.chapters], dtype=np.int32)
+
+		self.episode_season_idx = np.array(
+			[season_idx_by_number[episode.season.number] for episode in self.episodes], dtype=np.int32)
+
+		# Per-connection columns
+
+		episode_idx = []
+		position_in_episode = []
+		chapter_idx = []
+		strength = []
+		major = []
+		notes_id = []
+
+		# String table for notes, so each distinct note is only stored once
+		self.notes = []
+		notes_ids = {}
+
+		for ep_idx, episode in enumerate(self.episodes):
+			for position, connection in enumerate(episode.book_connections):
+
+				# Connections with no chapter, or a chapter that isn't in any book, are left out (these are reported by
+				# DB.find_sanity_violations)
+				chap_idx = chapter_idx_by_id.get(id(connection.chapter))
+				if chap_idx is None:
+					continue
+
+				episode_idx.append(ep_idx)
+				position_in_episode.append(position)
+				chapter_idx.append(chap_idx)
+				strength.append(connection.strength)
+				# Major comes straight from the CSV, so is a string
+				major.append(connection.major not in ('', '0'))
+
+				if connection.notes not in notes_ids:
+					notes_ids[connection.notes] = len(self.notes)
+					self.notes.append(connection.notes)
+				notes_id.append(notes_ids[connection.notes])
+
+		self.episode_idx = np.array(episode_idx, dtype=np.int32)
+		self.position_in_episode = np.array(position_in_episode, dtype=np.int32)  # Index in episode.book_connections
+		self.chapter_idx = np.array(chapter_idx, dtype=np.int32)
+		self.strength = np.array(strength, dtype=np.int8)
+		self.major = np.array(major, dtype=bool)
+		self.notes_id = np.array(notes_id, dtype=np.int32)
+
+	def __len__(self):
+		return len(self.episode_idx)
+
+	def find_sanity_violations(self) -> Dict[Tuple[int, int], SanityViolation]:
+		"""Vectorized check of connection values (see DB.find_sanity_violations)
+
+		:return: dict of (episode idx, index in episode.book_connections) -> violation, so that DB can put these in
+		order with its own violations
+		"""
+
+		bad_strength = (self.strength != 0) & (self.strength != 1)
+
+		violations = {}
+
+		for idx in np.nonzero(bad_strength)[0]:
+			ep_idx = int(self.episode_idx[idx])
+			source = get_connection_source(self.episodes[ep_idx], self.chapters[self.chapter_idx[idx]])
+			violations[(ep_idx, int(self.position_in_episode[idx]))] = SanityViolation(
+				source, 'Connection strength %i is not 0 or 1' % self.strength[idx])
+
+		return violations
+
+	def get_book_coverage(self) -> Dict[int, float]:
+		"""
+		:return: dict of book number -> fraction of chapters in book with at least 1 connection
+		"""
+
+		chapter_is_connected = np.bincount(self.chapter_idx, minlength=len(self.chapters)) > 0
+
+		num_connected = np.bincount(self.chapter_book_idx, weights=chapter_is_connected, minlength=len(self.books))
+		num_chapters = np.bincount(self.chapter_book_idx, minlength=len(self.books))
+
+		coverage = {}
+		for idx, book in enumerate(self.books):
+			if book.is_combined():
+				member_idxs = [self._book_idx_by_number[member.number] for member in book.combined_books]
+				connected = num_connected[member_idxs].sum()
+				total = num_chapters[member_idxs].sum()
+			else:
+				connected = num_connected[idx]
+				total = num_chapters[idx]
+
+			coverage[book.number] = float(connected / total) if total else 0.0
+
+		return coverage
+
+	def get_season_counts(self) -> Dict[int, int]:
+		"""
+		:return: dict of season number -> number of connections in season
+		"""
+		counts = np.bincount(self.episode_season_idx[self.episode_idx], minlength=len(self.seasons))
+		return {season.number: int(count) for season, count in zip(self.seasons, counts)}
+
+	def get_book_strengths(self):
+		"""
+		:return: 2D array of strongest connection strength, indexed by [episode idx, book idx]; -1 if no connections.
+		Includes combined books.
+		"""
+
+		strengths = np.full((len(self.episodes), len(self.books)), -1, dtype=np.int8)
+		np.maximum.at(strengths, (self.episode_idx, self.chapter_book_idx[self.chapter_idx]), self.strength)
+
+		for idx, book in enumerate(self.books):
+			if book.is_combined():
+				member_idxs = [self._book_idx_by_number[member.number] for member in book.combined_books]
+				strengths[:, idx] = strengths[:, member_idxs].max(axis=1)
+
+		return strengths
+
+	def get_book_strengths_dict(self) -> Dict[Tuple[int, int], int]:
+		"""
+		:return: dict of (episode number, book number) -> strongest connection strength, only for pairs that have
+		connections (same format as ConnectionIndex uses)
+		"""
+		strengths = self.get_book_strengths()
+		ep_idxs, book_idxs = np.nonzero(strengths >= 0)
+		return {
+			(self.episodes[ep_idx].number, self.books[book_idx].number): int(strengths[ep_idx, book_idx])
+			for ep_idx, book_idx in zip(ep_idxs, book_idxs)
+		}
+
+
+def check_stats(db):
+	"""Check that the vectorized stats from db.columnar match the same stats calculated from the DB directly
+
+	:raises: ValueError if they don't match
+	"""
+
+	connected_chapter_numbers = {
+		connection.chapter.number
+		for season in db.seasons for episode in season.episodes for connection in episode.book_connections}
+
+	# Combined books have the same chapters as their member books, so this doesn't need to handle them specially
+	book_coverage = {
+		book.number: (
+			len([chapter for chapter in book.chapters if chapter.number in connected_chapter_numbers]) /
+			len(book.chapters) if book.chapters else 0.0)
+		for book in db.books}
+
+	season_counts = {
+		season.number: sum([len(episode.book_connections) for episode in season.episodes])
+		for season in db.seasons}
+
+	for name, expected, actual in [
+			('book coverage', book_coverage, db.columnar.get_book_coverage()),
+			('season counts', season_counts, db.columnar.get_season_counts())]:
+		if actual != expected:
+			raise ValueError('Columnar %s do not match DB: %s vs %s' % (name, repr(actual), repr(expected)))
+
+
+def print_stats(db):
+	"""Print stats calculated from db.columnar"""
+
+	book_coverage = db.columnar.get_book_coverage()
+
+	print("Book coverage (chapters with at least 1 connection):")
+	for book in db.books:
+		print("  %s: %.1f%%" % (book.name, 100.0 * book_coverage[book.number]))
+
+	print("Connections per season:")
+	for season_number, count in db.columnar.get_season_counts().items():
+		print("  Season %i: %i" % (season_number, count))
@@ -32,11 +32,20 @@ A note from the author:
 
 
 import argparse
+import cProfile
 
 from utils import *
 from book_show_types import *
+import columnar
 import parsing
 import printing
+import snapshot
+import sqlite_db
+import incremental
+import variants
+import json_export
+import profiling
+import server
 
 
 ##### Hard-coded variables and other runtime parameters #####
@@ -49,9 +58,72 @@ _copyrightInfo = "(c) 2013-2018 Joel Geddert"
 
 def main():
 	parser = argparse.ArgumentParser()
+	parser.add_argument(
+		'command', nargs='?', choices=['build', 'serve'], default='build',
+		help='build: write output files (default); serve: serve chart over HTTP, re-rendering when input files change')
+	parser.add_argument('--host', default='127.0.0.1', help='Host to serve on')
+	parser.add_argument('--port', type=int, default=8000, help='Port to serve on')
 	parser.add_argument('-d', '--debug', action='store_true')
+	parser.add_argument(
+		'--columnar', action='store_true',
+		help='Use columnar connections for stats, and print book coverage & connections per season (requires NumPy)')
+	parser.add_argument(
+		'--cache-dir', default='cache',
+		help='Directory to store parsed data snapshots (unused with --sqlite) and incremental build state in')
+	parser.add_argument('--no-cache', action='store_true', help="Always parse input files; don't use snapshots")
+	parser.add_argument(
+		'--sqlite', metavar='FILE',
+		help='Store parsed data in SQLite database FILE instead of snapshots in --cache-dir (re-imported when input '
+		'files change; cannot be used with --no-cache)')
+	parser.add_argument(
+		'--incremental', action='store_true',
+		help='Only re-render table rows whose connections changed since the last incremental build')
+	parser.add_argument(
+		'--variants', nargs='*', metavar='PARAM=VALUES',
+		help='Also write a static print version for each combination of query string settings, e.g. '
+		'"--variants color=1 spoilers=0,2" (parameters not given take all values)')
+	parser.add_argument(
+		'--compact', action='store_true',
+		help='Write table body cells without classes, styled by their position instead (much smaller output)')
+	parser.add_argument(
+		'--json', action='store_true',
+		help='Also write the table data as JSON, and a page that renders only the visible part of the table from it')
+	parser.add_argument(
+		'-j', '--jobs', type=int, default=1,
+		help='Number of processes to render table body rows (and print version variants) with')
+	parser.add_argument(
+		'--stream', action='store_true',
+		help='Render each output file as it is written, so memory use does not depend on table size (with serve, '
+		'render main pages for each request and send them as chunked responses)')
+	parser.add_argument(
+		'--compress', choices=sorted(printing.compression_extensions.keys()),
+		help='Write compressed output files (implies --stream)')
+	parser.add_argument(
+		'--profile', action='store_true',
+		help='Print time, CPU time & memory allocated for each phase of the build, and number of cells & bytes written')
+	parser.add_argument(
+		'--profile-trace', metavar='FILE',
+		help='Write phases to FILE in Chrome trace format, for chrome://tracing or Perfetto (implies --profile)')
+	parser.add_argument('--cprofile', metavar='FILE', help='Write cProfile stats for the build to FILE')
 	args = parser.parse_args()
 
+	# Streaming renders each row as it is written, so there are no rendered rows for an incremental build to reuse
+	if args.incremental and (args.stream or args.compress):
+		parser.error('--stream and --compress cannot be used with --incremental')
+
+	if args.sqlite and args.no_cache:
+		parser.error('--no-cache cannot be used with --sqlite')
+
+	# Served pages are compressed according to what the client accepts
+	if args.command == 'serve' and args.compress:
+		parser.error('--compress cannot be used with serve')
+
+	if args.variants is not None:
+		try:
+			print_variants = variants.parse_variant_matrix(args.variants)
+		except ValueError as e:
+			parser.error(str(e))
+
 	set_debug(args.debug)
 
 	print("")
@@ -59,19 +131,83 @@ def main():
 	print(_copyrightInfo)
 	print("")
 
-	db = parsing.do_parsing()
+	if args.profile or args.profile_trace:
+		profiling.enable()
 
-	print("")
+	cprofiler = None
+	if args.cprofile:
+		cprofiler = cProfile.Profile()
+		cprofiler.enable()
+
+	def load_db():
+		if args.sqlite:
+			return sqlite_db.load_or_import(args.sqlite, build_columnar=args.columnar)
 
-	print("Sanity checking data")
-	db.sanity_check()
+		elif args.no_cache:
+			db = parsing.do_parsing(build_columnar=args.columnar)
+
+			print("")
+
+			print("Sanity checking data")
+			with profiling.phase('sanity_check'):
+				db.sanity_check()
+
+			return db
+
+		else:
+			return snapshot.load_or_parse(cache_dir=args.cache_dir, build_columnar=args.columnar)
+
+	with profiling.phase('load'):
+		db = load_db()
 
 	print("")
 
-	printing.do_printing(db)
+	if args.columnar:
+		with profiling.phase('columnar_stats'):
+			columnar.check_stats(db)
+			columnar.print_stats(db)
+		print("")
+
+	if args.command == 'serve':
+		server.serve(
+			db, load_db, host=args.host, port=args.port, jobs=args.jobs, compact=args.compact, stream=args.stream)
+		return
+
+	with profiling.phase('printing'):
+		if args.incremental:
+			incremental.do_incremental_printing(db, cache_dir=args.cache_dir, jobs=args.jobs, compact=args.compact)
+		else:
+			printing.do_printing(
+				db, jobs=args.jobs, stream=args.stream, compression=args.compress, compact=args.compact)
+
+	if args.json:
+		print("")
+		with profiling.phase('json'):
+			json_export.do_json_printing(db)
+
+	if args.variants is not None:
+		print("")
+		with profiling.phase('variants'):
+			variants.do_variant_printing(db, print_variants, jobs=args.jobs, compact=args.compact)
 
 	print("")
 
+	if cprofiler is not None:
+		cprofiler.disable()
+		cprofiler.dump_stats(args.cprofile)
+		print("Wrote cProfile stats: %s" % args.cprofile)
+		print("")
+
+	profiler = profiling.get_profiler()
+	if profiler is not None:
+		profiler.print_summary()
+		print("")
+
+		if args.profile_trace:
+			profiler.write_chrome_trace(args.profile_trace)
+			print("Wrote profile trace: %s" % args.profile_trace)
+			print("")
+
 	if warnings:
 		print("Complete, with warnings:")
 		for warning in warnings:
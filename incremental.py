@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from utils import *
+from book_show_types import *
+from typing import Dict, List, Tuple
+import book_show_types
+import parsing
+import printing
+import snapshot
+import utils
+import os
+import os.path
+import pickle
+
+
+# Increment this whenever the row cache format changes
+_row_cache_version = 1
+
+_row_cache_filename = 'rows.pickle'
+
+
+def get_base_hash(input_dir='input', compact=False) -> str:
+	"""
+	:param input_dir:
+	:param compact: whether rows are rendered compact (see printing.iter_main_table)
+	:return: hash of everything that body rows depend on, other than connections. If this changes, all rows need to be
+	re-rendered.
+	"""
+
+	books_filename, chapter_filename, combined_filename, episode_filename, _ = parsing.get_input_filenames(input_dir)
+
+	# Rows also depend on the code that renders them
+	source_filenames = [module.__file__ for module in [book_show_types, printing, utils]]
+
+	files_hash = snapshot.get_files_hash(
+		[books_filename, chapter_filename, combined_filename, episode_filename] + source_filenames,
+		_row_cache_version)
+
+	return files_hash + ('-compact' if compact else '')
+
+
+def get_connection_fingerprints(db: DB) -> Dict[int, List[Tuple]]:
+	"""
+	:return: dict of episode number -> everything about its connections that affects how its row is rendered
+	"""
+	return {
+		episode.number: [
+			(connection.chapter.number, connection.strength, connection.major, connection.notes)
+			for connection in episode.book_connections
+		]
+		for season in db.seasons for episode in season.episodes
+	}
+
+
+def load_row_cache(cache_dir: str, base_hash: str) -> Tuple[Dict[int, List[Tuple]], Dict[int, str]]:
+	"""
+	:return: (connection fingerprints, rendered rows) from the previous build; both empty if there was no previous
+	build, or if it was for a different base hash
+	"""
+
+	filename = os.path.join(cache_dir, _row_cache_filename)
+
+	if not os.path.isfile(filename):
+		return {}, {}
+
+	try:
+		with open(filename, 'rb') as f:
+			cached_base_hash, fingerprints, rendered_rows = pickle.load(f)
+	except Exception as e:
+		print('Failed to load row cache %s (%s), will do full build' % (filename, str(e)))
+		return {}, {}
+
+	if cached_base_hash != base_hash:
+		print('Books, chapters, episodes or rendering code changed, will do full build')
+		return {}, {}
+
+	return fingerprints, rendered_rows
+
+
+def save_row_cache(
+		cache_dir: str,
+		base_hash: str,
+		fingerprints: Dict[int, List[Tuple]],
+		rendered_rows: Dict[int, str]):
+
+	os.makedirs(cache_dir, exist_ok=True)
+
+	filename = os.path.join(cache_dir, _row_cache_filename)
+	temp_filename = filename + '.tmp'
+
+	with open(temp_filename, 'wb') as f:
+		pickle.dump((base_hash, fingerprints, rendered_rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+	os.replace(temp_filename, filename)
+
+
+def do_incremental_printing(db: DB, input_dir='input', cache_dir='cache', compact=False, **kwargs):
+	"""Same as printing.do_printing(), but only re-renders the body rows of episodes whose connections have changed since
+	the previous incremental build. Falls back to a full build if anything other than connections has changed.
+
+	:param db:
+	:param input_dir:
+	:param cache_dir: directory to store rendered rows in
+	:param compact: see printing.do_printing()
+	:param kwargs: passed to printing.do_printing()
+	"""
+
+	base_hash = get_base_hash(input_dir, compact)
+	fingerprints = get_connection_fingerprints(db)
+
+	prev_fingerprints, rendered_rows = load_row_cache(cache_dir, base_hash)
+
+	# Only keep rows for episodes whose connections are exactly the same as last time
+	rendered_rows = {
+		ep_num: row for ep_num, row in rendered_rows.items()
+		if ep_num in fingerprints and prev_fingerprints.get(ep_num) == fingerprints[ep_num]
+	}
+
+	print('Reusing %i of %i rendered episode rows' % (len(rendered_rows), len(fingerprints)))
+
+	printing.do_printing(db, input_dir=input_dir, rendered_rows=rendered_rows, compact=compact, **kwargs)
+
+	save_row_cache(cache_dir, base_hash, fingerprints, rendered_rows)
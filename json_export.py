@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from utils import *
+from book_show_types import *
+from typing import Dict, Tuple
+import printing
+import profiling
+import json
+import os.path
+import zlib
+
+
+# Increment this whenever the payload format changes (output/js/got-virtual.js checks it)
+_payload_version = 1
+
+_json_filename = 'bookshow.json'
+_virtual_filename = 'bookshow-virtual.html'
+
+
+def get_chart_data(db: DB) -> Dict:
+	"""Get everything needed to render the main table client-side (see output/js/got-virtual.js)
+
+	To keep the payload small, items are lists rather than dicts, and connections are sparse (only cells that have
+	one are included). Anything whose rendering is non-trivial (chapter name abbreviations, notes escaping, summary
+	cell strengths) is done here, so the client renders exactly the same cells as the static table.
+
+	Fields of each item:
+		books: [number, name, abbreviation, [combined book numbers], [[chapter number, display name], ...]]
+		chapters: [number, book number, name, POV, occurred (0/1)]
+		episodes: [number, season number, number in season, name, row classes]
+		connections: [episode number, chapter number, strength, notes] - multiple connections between the same episode
+			& chapter are merged, as in the static table
+		bookStrengths: [episode number, book number, strength] - strongest connection to any chapter in book
+	"""
+
+	conn_index = ConnectionIndex(db)
+	columns = printing.get_all_chapter_columns(db.books)
+
+	episodes = [episode for season in db.seasons for episode in season.episodes]
+
+	connections = []
+	for episode in episodes:
+		for chapter_number in sorted({connection.chapter.number for connection in episode.book_connections}):
+			matching_connections = conn_index.get_connections(episode, db.find_chapter_by_number(chapter_number))
+			notes = '; '.join([c.notes for c in matching_connections if c.notes])
+			connections.append([
+				episode.number,
+				chapter_number,
+				max([c.strength for c in matching_connections]),
+				htmlize_string(notes)])
+
+	book_strengths = []
+	for episode in episodes:
+		for book in db.books:
+			strength = conn_index.get_book_strength(episode, book)
+			if strength is not None:
+				book_strengths.append([episode.number, book.number, strength])
+
+	return {
+		'version': _payload_version,
+		'books': [
+			[
+				book.number,
+				book.name,
+				book.abbreviation,
+				[member.number for member in book.combined_books],
+				[
+					[column.chapter.number, printing.get_chapter_display_name(column)]
+					for column in columns[book.number]
+				],
+			]
+			for book in db.books
+		],
+		'chapters': [
+			[chapter.number, chapter.book.number, chapter.name, chapter.pov, int(chapter.occurred)]
+			for book in db.books if not book.is_combined() for chapter in book.chapters
+		],
+		'episodes': [
+			[episode.number, episode.season.number, episode.number_in_season, episode.name,
+				printing.get_episode_row_classes(episode)]
+			for episode in episodes
+		],
+		'connections': connections,
+		'bookStrengths': book_strengths,
+	}
+
+
+def render_chart_data(db: DB) -> str:
+	return json.dumps(get_chart_data(db), separators=(',', ':'))
+
+
+def render_virtual_main_table() -> str:
+	"""Placeholder for main table div, which got-virtual.js fills in with only the visible cells"""
+	w = printing.FileWriter(buffered=True)
+	w.opl('<div id="maintablediv">')
+	w.opl('<table id="maintable" class="virtual"></table>')
+	w.opl('</div> <!-- /maintablediv -->')
+	w.opl('<script>var chartDataUrl = "%s";</script>' % _json_filename)
+	w.opl('<script src="js/got-virtual.js"></script>')
+	return w.take_buffer()
+
+
+def get_file_sizes(filename: str) -> Tuple[int, int]:
+	"""
+	:return: (size, gzipped size) of file, in bytes
+	"""
+	with open(filename, 'rb') as f:
+		data = f.read()
+	return len(data), len(zlib.compress(data, 9))
+
+
+def print_size_comparison(json_filename: str, virtual_filename: str, html_filename: str):
+	"""Print how much needs to be downloaded for the virtual page (page + JSON) vs the static table page"""
+
+	json_size, json_gz_size = get_file_sizes(json_filename)
+	virtual_size, virtual_gz_size = get_file_sizes(virtual_filename)
+
+	print('%s: %i bytes (%i gzipped)' % (json_filename, json_size, json_gz_size))
+	print('%s: %i bytes (%i gzipped)' % (virtual_filename, virtual_size, virtual_gz_size))
+
+	if not os.path.isfile(html_filename):
+		return
+
+	html_size, html_gz_size = get_file_sizes(html_filename)
+
+	total_size = json_size + virtual_size
+	total_gz_size = json_gz_size + virtual_gz_size
+
+	print('%s: %i bytes (%i gzipped) - virtual page + JSON is %.1f%% of this (%.1f%% gzipped)' % (
+		html_filename, html_size, html_gz_size, 100.0 * total_size / html_size, 100.0 * total_gz_size / html_gz_size))
+
+
+def get_json_filename(output_dir='output') -> str:
+	return os.path.join(output_dir, _json_filename)
+
+
+def get_virtual_document(input_dir='input', output_dir='output') -> printing.OutputDocument:
+	return printing.OutputDocument(
+		template_filename=os.path.join(input_dir, 'template.html'),
+		output_filename=os.path.join(output_dir, _virtual_filename),
+		is_print_version=False)
+
+
+def do_json_printing(db: DB, input_dir='input', output_dir='output'):
+	"""Write JSON payload, and a version of the main page that renders the table from it client-side (only rendering
+	the cells that are currently visible). The page loads the payload over HTTP, so needs to be served (e.g. by
+	"got.py serve") rather than opened as a file.
+	"""
+
+	json_filename = get_json_filename(output_dir)
+	doc = get_virtual_document(input_dir, output_dir)
+
+	print('Writing JSON file: %s' % json_filename)
+	with profiling.phase('write JSON', file=json_filename):
+		with open(json_filename, 'w') as f:
+			f.write(render_chart_data(db))
+
+	profiling.count_file_size(json_filename)
+
+	printing.write_documents([(doc, render_virtual_main_table())], db, parallel=False)
+
+	print_size_comparison(json_filename, doc.output_filename, os.path.join(output_dir, 'bookshow.html'))
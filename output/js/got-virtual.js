@@ -0,0 +1,446 @@
+/*
+Game of Thrones chapters vs episodes chart
+Copyright (c) 2013-2018, Joel Geddert
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/*
+Virtualized version of the main table, for bookshow-virtual.html
+
+Instead of the page containing every cell of the table, the table data is loaded from a JSON file (see
+json_export.py), and only the cells currently scrolled into view are rendered. Cells outside of the view are
+replaced by spacers of the same size, so scrolling works the same as the static table. Rendered cells have the
+same classes as the static table, so all the same CSS applies.
+
+Must be loaded after got.js, as it replaces some of its functions.
+*/
+
+var payloadVersion = 1;
+
+// Same as printing.py
+var nStripe = 5;
+
+// Extra rows & columns to render outside of the view, so that small scrolls don't need a re-render
+var overscanRows = 5;
+var overscanCols = 20;
+
+// Initial estimates of cell sizes in pixels; these get measured once the table has been rendered
+var rowHeight = 13;
+var chapterColWidth = 11;
+var summaryColWidth = 19;
+
+var chartData = null;
+var chapterInfo = {};        // chapter number -> [book number, name, POV, occurred]
+var combinedBookNum = {};    // book number -> number of combined book it is part of
+var cellConnections = {};    // episode number -> chapter number -> [strength, notes]
+var bookStrengths = {};      // episode number -> book number -> strength
+var seasonLengths = {};      // season number -> number of episodes
+
+var columns = [];            // Columns currently shown (depends on collapsed/combined books)
+var renderedWindow = null;   // [first row, last row, first col, last col] of currently rendered cells
+var renderPending = false;
+
+function htmlEscape(s) {
+	return s.replace(/&/g, "&amp;").replace(/"/g, "&quot;");
+}
+
+function spacerStyle(width, height) {
+	var style = "border:0;background:none;padding:0;";
+	if (width !== null) { style += "width:" + width + "px;min-width:" + width + "px;"; }
+	if (height !== null) { style += "height:" + height + "px;"; }
+	return ' style="' + style + '"';
+}
+
+function isBookExpanded(book) {
+	var members = book[3];
+	if (members.length == 0) {
+		return booksExpanded[book[0] - 1];
+	}
+	for (var i = 0; i < members.length; i++) {
+		if (booksExpanded[members[i] - 1]) { return true; }
+	}
+	return false;
+}
+
+function setBookExpanded(n, expanded) {
+	for (var i = 0; i < chartData.books.length; i++) {
+		var book = chartData.books[i];
+		if (book[0] != n) { continue; }
+
+		if (book[3].length == 0) {
+			booksExpanded[n - 1] = expanded;
+		} else {
+			for (var j = 0; j < book[3].length; j++) { booksExpanded[book[3][j] - 1] = expanded; }
+		}
+	}
+}
+
+function indexChartData(data) {
+	chartData = data;
+
+	for (var i = 0; i < data.chapters.length; i++) {
+		var chapter = data.chapters[i];
+		chapterInfo[chapter[0]] = [chapter[1], chapter[2], chapter[3], chapter[4]];
+	}
+
+	for (var i = 0; i < data.books.length; i++) {
+		var book = data.books[i];
+		for (var j = 0; j < book[3].length; j++) { combinedBookNum[book[3][j]] = book[0]; }
+	}
+
+	for (var i = 0; i < data.connections.length; i++) {
+		var conn = data.connections[i];
+		if (!(conn[0] in cellConnections)) { cellConnections[conn[0]] = {}; }
+		cellConnections[conn[0]][conn[1]] = [conn[2], conn[3]];
+	}
+
+	for (var i = 0; i < data.bookStrengths.length; i++) {
+		var bs = data.bookStrengths[i];
+		if (!(bs[0] in bookStrengths)) { bookStrengths[bs[0]] = {}; }
+		bookStrengths[bs[0]][bs[1]] = bs[2];
+	}
+
+	for (var i = 0; i < data.episodes.length; i++) {
+		var season = data.episodes[i][1];
+		seasonLengths[season] = (seasonLengths[season] || 0) + 1;
+	}
+}
+
+// Same as printing.get_chapter_columns, for the books currently shown
+function buildColumns() {
+	var combine = document.getElementsByName("combine45checkbox")[0].checked;
+
+	columns = [];
+
+	for (var i = 0; i < chartData.books.length; i++) {
+		var book = chartData.books[i];
+		var isCombined = book[3].length > 0;
+		var isMember = book[0] in combinedBookNum;
+
+		if ((isCombined && !combine) || (isMember && combine)) { continue; }
+
+		if (!isBookExpanded(book)) {
+			columns.push({book: book, summary: true});
+			continue;
+		}
+
+		var chapters = book[4];
+		for (var pos = 0; pos < chapters.length; pos++) {
+			var chapterNum = chapters[pos][0];
+			var baseClasses = isCombined ?
+				"b" + book[0] + " b" + chapterInfo[chapterNum][0] + "co" :
+				"b" + chapterInfo[chapterNum][0];
+
+			var borderClasses = "";
+			if (pos == 0) { borderClasses += " lb"; }
+			if (pos == chapters.length - 1) { borderClasses += " rb"; }
+
+			columns.push({
+				book: book,
+				summary: false,
+				chapter: chapterNum,
+				displayName: chapters[pos][1],
+				baseClasses: baseClasses,
+				borderClasses: borderClasses,
+				striped: pos % nStripe == 0,
+			});
+		}
+	}
+
+	renderedWindow = null;
+}
+
+function colWidth(col) {
+	return col.summary ? summaryColWidth : chapterColWidth;
+}
+
+function renderBookHeaders(firstCol, lastCol) {
+	var html = "";
+	var col = firstCol;
+
+	while (col <= lastCol) {
+		var book = columns[col].book;
+		var name = htmlEscape(book[1]);
+
+		if (columns[col].summary) {
+			html += '<th rowspan="2" class="booktitle b' + book[0] + 'title b' + book[0] + 'c" style="display:table-cell"' +
+				' onclick="expandbook(' + book[0] + ')"><img src="imgs/b' + book[0] + 'coll.png" alt="' + name + '"></th>';
+			col++;
+			continue;
+		}
+
+		var count = 0;
+		var width = 0;
+		while (col <= lastCol && columns[col].book === book) { width += colWidth(columns[col]); count++; col++; }
+
+		// If only part of the book is in view, don't let the title image stretch the columns
+		var img = '<img src="imgs/b' + book[0] + 'title.png" alt="' + name + '">';
+		if (count < book[4].length) {
+			img = '<div style="width:' + (width - 1) + 'px;overflow:hidden">' + img + '</div>';
+		}
+
+		html += '<th colspan="' + count + '" class="booktitle b' + book[0] + 'title b' + book[0] + '"' +
+			' style="display:table-cell" onclick="collapsebook(' + book[0] + ')">' + img + '</th>';
+	}
+
+	return html;
+}
+
+function renderChapterHeaders(firstCol, lastCol) {
+	var html = "";
+
+	for (var c = firstCol; c <= lastCol; c++) {
+		var col = columns[c];
+		if (col.summary) { continue; }
+
+		var info = chapterInfo[col.chapter];
+		var classes = "cn " + col.baseClasses + " bb" + col.borderClasses + (col.striped ? " s" : "");
+
+		if (!/[A-Za-z0-9]/.test(info[1])) {
+			html += '<th class="' + classes + '" style="display:table-cell"><div class="cni nonrotate">?</div></th>';
+		} else {
+			html += '<th class="' + classes + '" style="display:table-cell" title="' + info[1] + '"><div class="cnr">' +
+				'<div class="cni' + (info[3] ? "" : " ho") + '">' + col.displayName + '</div></div></th>';
+		}
+	}
+
+	return html;
+}
+
+function renderConnection(strength, notes, pov) {
+	var classes = "c";
+	if (pov !== null) { classes += " pov" + pov.toLowerCase(); }
+	classes += strength ? " sc" : " wc";
+
+	if (notes) {
+		return '<div class="' + classes + '" title="' + notes + '"></div>';
+	}
+	return '<div class="' + classes + '"></div>';
+}
+
+// Returns just the cells, not the <tr>
+function renderRowCells(episode, firstCol, lastCol) {
+	var epNum = episode[0];
+	var numInSeason = episode[2];
+
+	var rowBorders = "";
+	if (numInSeason == 1) { rowBorders += " tb"; }
+	if (numInSeason == seasonLengths[episode[1]]) { rowBorders += " bb"; }
+	var rowStriped = numInSeason % nStripe == 1;
+
+	var conns = cellConnections[epNum] || {};
+	var strengths = bookStrengths[epNum] || {};
+
+	var html = "";
+
+	for (var c = firstCol; c <= lastCol; c++) {
+		var col = columns[c];
+
+		if (col.summary) {
+			html += '<td class="b' + col.book[0] + 'c lb rb' + rowBorders + (rowStriped ? " s" : "") +
+				'" style="display:table-cell">';
+			if (col.book[0] in strengths) { html += renderConnection(strengths[col.book[0]], "", null); }
+			html += '</td>';
+			continue;
+		}
+
+		html += '<td class="' + col.baseClasses + rowBorders + col.borderClasses +
+			(col.striped || rowStriped ? " s" : "") + '" style="display:table-cell">';
+
+		var conn = conns[col.chapter];
+		if (conn) { html += renderConnection(conn[0], conn[1], chapterInfo[col.chapter][2]); }
+
+		html += '</td>';
+	}
+
+	return html;
+}
+
+function getVisibleWindow() {
+	var table = document.getElementById("maintable");
+	var tableDiv = document.getElementById("maintablediv");
+	var head = table.tHead;
+
+	var bodyTop = table.getBoundingClientRect().top + (head ? head.offsetHeight : 0);
+	var numRows = chartData.episodes.length;
+
+	var firstRow = Math.max(0, Math.floor(-bodyTop / rowHeight) - overscanRows);
+	var lastRow = Math.min(numRows - 1, Math.ceil((window.innerHeight - bodyTop) / rowHeight) + overscanRows);
+	if (lastRow < firstRow) { lastRow = firstRow; }
+
+	var left = tableDiv.scrollLeft;
+	var right = left + tableDiv.clientWidth;
+
+	var firstCol = 0;
+	var x = 0;
+	while (firstCol < columns.length - 1 && x + colWidth(columns[firstCol]) < left) {
+		x += colWidth(columns[firstCol]);
+		firstCol++;
+	}
+
+	var lastCol = firstCol;
+	while (lastCol < columns.length - 1 && x < right) {
+		x += colWidth(columns[lastCol]);
+		lastCol++;
+	}
+
+	return [
+		firstRow,
+		lastRow,
+		Math.max(0, firstCol - overscanCols),
+		Math.min(columns.length - 1, lastCol + overscanCols),
+	];
+}
+
+function renderTable() {
+	renderPending = false;
+
+	if (chartData === null) { return; }
+
+	var w = getVisibleWindow();
+	if (renderedWindow !== null &&
+		w[0] == renderedWindow[0] && w[1] == renderedWindow[1] &&
+		w[2] == renderedWindow[2] && w[3] == renderedWindow[3]) {
+		return;
+	}
+	renderedWindow = w;
+
+	var firstRow = w[0], lastRow = w[1], firstCol = w[2], lastCol = w[3];
+	var numRows = chartData.episodes.length;
+
+	var leftWidth = 0;
+	for (var c = 0; c < firstCol; c++) { leftWidth += colWidth(columns[c]); }
+
+	var rightWidth = 0;
+	for (var c = lastCol + 1; c < columns.length; c++) { rightWidth += colWidth(columns[c]); }
+
+	var numCols = lastCol - firstCol + 1 + (leftWidth ? 1 : 0) + (rightWidth ? 1 : 0);
+	var leftSpacer = leftWidth ? "<td" + spacerStyle(leftWidth, null) + "></td>" : "";
+	var rightSpacer = rightWidth ? "<td" + spacerStyle(rightWidth, null) + "></td>" : "";
+
+	var html = '<thead><tr class="booktitlerow">';
+	if (leftWidth) { html += '<th rowspan="2"' + spacerStyle(leftWidth, null) + '></th>'; }
+	html += renderBookHeaders(firstCol, lastCol);
+	if (rightWidth) { html += '<th rowspan="2"' + spacerStyle(rightWidth, null) + '></th>'; }
+	html += '</tr><tr>' + renderChapterHeaders(firstCol, lastCol) + '</tr></thead><tbody>';
+
+	if (firstRow > 0) {
+		html += '<tr><td colspan="' + numCols + '"' + spacerStyle(null, firstRow * rowHeight) + '></td></tr>';
+	}
+
+	for (var r = firstRow; r <= lastRow; r++) {
+		html += '<tr class="' + chartData.episodes[r][4] + '">' + leftSpacer +
+			renderRowCells(chartData.episodes[r], firstCol, lastCol) + rightSpacer + '</tr>';
+	}
+
+	if (lastRow < numRows - 1) {
+		html += '<tr><td colspan="' + numCols + '"' + spacerStyle(null, (numRows - 1 - lastRow) * rowHeight) + '></td></tr>';
+	}
+
+	html += '</tbody>';
+
+	document.getElementById("maintable").innerHTML = html;
+}
+
+// Measure actual cell sizes, so that spacers match the size of the cells they replace
+function measureCells() {
+	var table = document.getElementById("maintable");
+	var rows = table.tBodies[0].rows;
+	var measured = false;
+
+	for (var i = 0; i < rows.length; i++) {
+		if (rows[i].className) {
+			rowHeight = rows[i].offsetHeight;
+			measured = true;
+			break;
+		}
+	}
+
+	var headers = table.tHead.rows[1].cells;
+	if (headers.length > 0) {
+		chapterColWidth = headers[0].offsetWidth;
+	}
+
+	renderedWindow = null;
+	return measured;
+}
+
+function scheduleRender() {
+	if (!renderPending) {
+		renderPending = true;
+		window.requestAnimationFrame(renderTable);
+	}
+}
+
+// Replacements for got.js functions that show & hide cells - here, cells not shown just don't get rendered
+
+function expandbook(n) {
+	setBookExpanded(n, true);
+	buildColumns();
+	renderTable();
+}
+
+function collapsebook(n) {
+	setBookExpanded(n, false);
+	buildColumns();
+	renderTable();
+}
+
+function combine45() {
+	if (chartData === null) { return; }
+	buildColumns();
+	renderTable();
+}
+
+function floatleft() {
+	// The virtual table has no episode title columns of its own, so always use the floating table
+	document.getElementById("floatingtable").style.display="block";
+	document.getElementById("maintable").style.left="-1px";
+}
+
+function loadChartData() {
+	var request = new XMLHttpRequest();
+	request.open("GET", chartDataUrl);
+
+	request.onload = function() {
+		if (request.status != 200) {
+			console.log("Failed to load " + chartDataUrl + ": " + request.status);
+			return;
+		}
+
+		var data = JSON.parse(request.responseText);
+		if (data.version != payloadVersion) {
+			console.log("Unsupported chart data version: " + data.version);
+			return;
+		}
+
+		indexChartData(data);
+		buildColumns();
+		renderTable();
+
+		if (measureCells()) { renderTable(); }
+
+		console.log("Virtual table first render: " + Math.round(performance.now()) + " ms after navigation start");
+	};
+
+	request.send();
+}
+
+window.addEventListener("scroll", scheduleRender);
+window.addEventListener("resize", scheduleRender);
+document.getElementById("maintablediv").addEventListener("scroll", scheduleRender);
+
+loadChartData();
@@ -27,11 +27,8 @@ var colorclasses = "cpov";
 var booksExpanded = [true,true,true,true,true,true];
 
 function expandbook(n) {
-	var divs = document.getElementsByClassName("b" + n);
-	for(var i = 0; i < divs.length; i++) { divs[i].style.display="table-cell"; }
-	
-	divs = document.getElementsByClassName("b" + n + "c");
-	for(var i = 0; i < divs.length; i++) { divs[i].style.display="none"; }
+	setClassDisplay("b" + n, "table-cell");
+	setClassDisplay("b" + n + "c", "none");
 
 	if (n != 45) {
 		booksExpanded[n-1] = true;
@@ -42,11 +39,8 @@ function expandbook(n) {
 }
 
 function collapsebook(n) {
-	var divs = document.getElementsByClassName("b" + n);
-	for(var i = 0; i < divs.length; i++) { divs[i].style.display="none"; }
-	
-	divs = document.getElementsByClassName("b" + n + "c");
-	for(var i = 0; i < divs.length; i++) { divs[i].style.display="table-cell"; }
+	setClassDisplay("b" + n, "none");
+	setClassDisplay("b" + n + "c", "table-cell");
 
 	if (n != 45) {
 		booksExpanded[n-1] = false;
@@ -56,53 +50,67 @@ function collapsebook(n) {
 	}	
 }
 
+/*
+Show or hide everything with a class. Compact tables (see printing.py) don't have classes on their body cells, so those
+get hidden by adding "h" + class name to the table instead.
+*/
+function setClassDisplay(className, display) {
+	var divs = document.getElementsByClassName(className);
+	for(var i = 0; i < divs.length; i++) { divs[i].style.display=display; }
+
+	var table = document.getElementById("maintable");
+	if (table.classList.contains("compact")) {
+		table.classList.toggle("h" + className, display == "none");
+	}
+}
+
 function getClassAsArray(className) {
 	return Array.prototype.slice.call(document.getElementsByClassName(className));
 }
 
 function combine45() {
 
-	var divsShow = [];
-	var divsHide = [];
+	var classesShow = [];
+	var classesHide = [];
 
 	if(document.getElementsByName("combine45checkbox")[0].checked) {
 		if(booksExpanded[3] || booksExpanded[4]) {
-			divsShow = divsShow.concat(getClassAsArray("b45"));
-			divsHide = divsHide.concat(getClassAsArray("b45c"));
+			classesShow.push("b45");
+			classesHide.push("b45c");
 		} else {
-			divsShow = divsShow.concat(getClassAsArray("b45c"));
-			divsHide = divsHide.concat(getClassAsArray("b45"));
+			classesShow.push("b45c");
+			classesHide.push("b45");
 		}
 
-		divsHide = divsHide.concat(getClassAsArray("b4"));
-		divsHide = divsHide.concat(getClassAsArray("b5"));
-		divsHide = divsHide.concat(getClassAsArray("b4c"));
-		divsHide = divsHide.concat(getClassAsArray("b5c"));
+		classesHide.push("b4");
+		classesHide.push("b5");
+		classesHide.push("b4c");
+		classesHide.push("b5c");
 
 	} else {
 
 		if(booksExpanded[3]) {
-			divsShow = divsShow.concat(getClassAsArray("b4"));
-			divsHide = divsHide.concat(getClassAsArray("b4c"));
+			classesShow.push("b4");
+			classesHide.push("b4c");
 		} else {
-			divsShow = divsShow.concat(getClassAsArray("b4c"));
-			divsHide = divsHide.concat(getClassAsArray("b4"));
+			classesShow.push("b4c");
+			classesHide.push("b4");
 		}
 		
 		if(booksExpanded[4]) {
-			divsShow = divsShow.concat(getClassAsArray("b5"));
-			divsHide = divsHide.concat(getClassAsArray("b5c"));
+			classesShow.push("b5");
+			classesHide.push("b5c");
 		} else {
-			divsShow = divsShow.concat(getClassAsArray("b5c"));
-			divsHide = divsHide.concat(getClassAsArray("b5"));
+			classesShow.push("b5c");
+			classesHide.push("b5");
 		}
 
-		divsHide = divsHide.concat(getClassAsArray("b45"));
-		divsHide = divsHide.concat(getClassAsArray("b45c"));
+		classesHide.push("b45");
+		classesHide.push("b45c");
 	}
 
-	for(var i = 0; i < divsShow.length; i++) { divsShow[i].style.display="table-cell"; }
-	for(var i = 0; i < divsHide.length; i++) { divsHide[i].style.display="none"; }
+	for(var i = 0; i < classesShow.length; i++) { setClassDisplay(classesShow[i], "table-cell"); }
+	for(var i = 0; i < classesHide.length; i++) { setClassDisplay(classesHide[i], "none"); }
 }
 
 function floatleft() {
@@ -31,6 +31,11 @@ A note from the author:
 
 from utils import *
 from book_show_types import *
+import columnar
+import profiling
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+import itertools
 import os.path
 import csv
 
@@ -56,7 +61,7 @@ def parse_books(filename):
 	return book_list
 
 
-def parse_chapters(filename, book_list):
+def parse_chapters(filename, db):
 	chapter_list = []
 	total_chap_num = 0
 
@@ -72,7 +77,7 @@ def parse_chapters(filename, book_list):
 			# e.g. color by storyline or location
 			book_name, chap_num_in_book, chap_name, pov_char, _, _, _, occurred = row
 
-			book = find_unique(book_list, lambda book: book.name == book_name)
+			book = db.find_book_by_name(book_name)
 			chap_num_in_book = int(chap_num_in_book) + 1  # 0-indexed in csv (i.e. prologue is 0)
 
 			if chap_num_in_book != len(book.chapters) + 1:
@@ -104,7 +109,7 @@ def parse_chapters(filename, book_list):
 			)
 
 			chapter_list.append(chapter)
-			book.chapters.append(chapter)
+			db.add_chapter(book, chapter)
 
 	debug_print(repr(chapter_list[0:10]))
 
@@ -119,7 +124,7 @@ def parse_combined_order(filename, chapters, books):
 		abbreviation='AFfC + ADwD',
 		combined_books=[books[3], books[4]])
 
-	with open(filename, 'rU') as txt_file:
+	with open(filename, 'r') as txt_file:
 		while True:
 			line = txt_file.readline()
 			if not line:
@@ -151,9 +156,8 @@ def parse_combined_order(filename, chapters, books):
 	return combined_book
 
 
-def parse_episodes(filename):
+def parse_episodes(filename, db):
 	episode_list = []
-	season_list = []
 
 	with open(filename) as csvFile:
 
@@ -176,11 +180,11 @@ def parse_episodes(filename):
 			name = name[1:-1]
 			debug_print(name)
 
-			season = find_unique(season_list, lambda season: season.number == season_num, throw_if_not_found=False)
+			season = db.find_season(season_num, throw_if_not_found=False)
 			if season is None:
 				debug_print('Adding season %i' % season_num)
 				season = Season(number=season_num)
-				season_list.append(season)
+				db.add_season(season)
 
 			if num_in_season != len(season.episodes) + 1:
 				raise ValueError('Episode number in season does not match order: expected number %i, row %s' % (
@@ -197,78 +201,255 @@ def parse_episodes(filename):
 				name=name)
 
 			episode_list.append(episode)
-			season.episodes.append(episode)
+			db.add_episode(season, episode)
 
-	return episode_list, season_list
+	return episode_list
 
 
-def parse_connections(filename, db):
-	conn_list = []
-	with open(filename) as csvFile:
-		reader = csv.reader(csvFile)
-		for row in reader:
-			if row[0].isdigit():
+# Rows of connections file are read & resolved this many at a time
+_connection_batch_size = 4096
+
+# Read buffer size for connections file, in bytes
+_connection_read_buffer_size = 1 << 20
+
+# parse_connections only warns about this many rejected rows individually, so that warnings don't grow without bound
+_max_rejected_row_warnings = 100
+
+
+@dataclass
+class RejectedRow:
+	line_num: int
+	row: List[str]
+	reason: str
+
+	def __str__(self):
+		return 'line %i: %s: %s' % (self.line_num, self.reason, ','.join(self.row))
+
+
+@dataclass
+class ConnectionIngestStats:
+	rows: int = 0  # Data rows read (i.e. not including header)
+	connections: int = 0  # Connections added to episodes
+	skipped: int = 0  # Rows with no chapter given (blank or "?"), which are expected and not errors
+	rejected: int = 0  # Rows that could not be parsed or resolved
+
+
+def iter_connection_row_batches(
+		filename: str,
+		batch_size=_connection_batch_size) -> Iterator[List[Tuple[int, List[str]]]]:
+	"""Read connections CSV file in batches, without reading the whole file into memory
+
+	:param filename:
+	:param batch_size: max number of rows per batch
+	:return: iterator of lists of (line number, row), not including header and other non-data rows
+	"""
+	with open(filename, newline='', buffering=_connection_read_buffer_size) as csv_file:
+		reader = csv.reader(csv_file)
+		numbered_rows = ((reader.line_num, row) for row in reader)
+
+		while True:
+			rows = list(itertools.islice(numbered_rows, batch_size))
+			if not rows:
+				return
+
+			batch = [(line_num, row) for line_num, row in rows if row and row[0].isdigit()]
+			if batch:
+				yield batch
+
+
+def ingest_connections(
+		filename: str,
+		db: DB,
+		stats: Optional[ConnectionIngestStats]=None,
+		on_connection: Optional[Callable[[Connection], None]]=None,
+		batch_size=_connection_batch_size,
+		add_to_db=True) -> Iterator[RejectedRow]:
+	"""Stream connections from CSV file, adding them to the DB (see DB.add_connection) as it goes
+
+	Rows are read & resolved in batches; each distinct chapter & episode is only looked up once. Memory use doesn't
+	depend on file size, other than the connections themselves.
+
+	:param filename:
+	:param db: DB with books, chapters & episodes already parsed
+	:param stats: optional counts to add to
+	:param on_connection: optional function to call with each connection, after it is added to its episode
+	:param batch_size: number of rows to read & resolve at a time
+	:param add_to_db: if False, connections will only be passed to on_connection, not added to the DB (so they don't
+	stay in memory)
+	:return: iterator of rows that were rejected, in order (connections are only added as this is consumed)
+	"""
+
+	if stats is None:
+		stats = ConnectionIngestStats()
+
+	# Resolved (book number, chapter name) -> chapter, and (season number, episode number) -> episode
+	# If lookup failed, value is the reason instead
+	chapters = {}
+	episodes = {}
+
+	def find_chapter(key):
+		try:
+			return db.find_chapter(key[1], key[0])
+		except ValueError as e:
+			return 'Chapter lookup failed (%s)' % e
+
+	def find_episode(key):
+		try:
+			return db.find_episode(*key)
+		except ValueError as e:
+			return 'Episode lookup failed (%s)' % e
+
+	for batch in iter_connection_row_batches(filename, batch_size):
+
+		stats.rows += len(batch)
+
+		rejected_rows = []
+
+		# Validate rows
+
+		valid_rows = []  # (line number, row, chapter key, episode key, strength, major, notes)
 
-				seas_num, ep_num_in_season, book_num, chap_name, strength, major, notes = row
+		for line_num, row in batch:
+
+			if len(row) != 7:
+				rejected_rows.append(RejectedRow(line_num, row, 'Expected 7 columns, got %i' % len(row)))
+				continue
+
+			seas_num, ep_num_in_season, book_num, chap_name, strength, major, notes = row
+
+			if (chap_name == '') or (chap_name == '?'):
+				stats.skipped += 1
+				continue
+
+			if not (seas_num.isdigit() and ep_num_in_season.isdigit() and book_num.isdigit()):
+				rejected_rows.append(RejectedRow(line_num, row, 'Season, episode & book must be numbers'))
+				continue
+
+			if strength not in ['0', '1']:
+				rejected_rows.append(RejectedRow(line_num, row, 'Chapter strength not 0 or 1'))
+				continue
+
+			valid_rows.append((
+				line_num, row,
+				(int(book_num), chap_name), (int(seas_num), int(ep_num_in_season)),
+				int(strength), major, notes))
+
+		# Resolve any chapters & episodes not seen in a previous batch
+
+		for _, _, chapter_key, episode_key, _, _, _ in valid_rows:
+			if chapter_key not in chapters:
+				chapters[chapter_key] = find_chapter(chapter_key)
+			if episode_key not in episodes:
+				episodes[episode_key] = find_episode(episode_key)
+
+		# Add connections
+
+		for line_num, row, chapter_key, episode_key, strength, major, notes in valid_rows:
+
+			chapter = chapters[chapter_key]
+			episode = episodes[episode_key]
+
+			if isinstance(chapter, str) or isinstance(episode, str):
+				rejected_rows.append(RejectedRow(line_num, row, chapter if isinstance(chapter, str) else episode))
+				continue
+
+			connection = Connection(
+				episode=episode,
+				chapter=chapter,
+				strength=strength,
+				major=major,
+				notes=notes,
+			)
+
+			if add_to_db:
+				db.add_connection(connection)
+
+			stats.connections += 1
+
+			if on_connection is not None:
+				on_connection(connection)
+
+		stats.rejected += len(rejected_rows)
+		yield from sorted(rejected_rows, key=lambda rejected_row: rejected_row.line_num)
 
-				seas_num = int(seas_num)
-				ep_num_in_season = int(ep_num_in_season)
-				book_num = int(book_num)
 
-				if (chap_name == '') or (chap_name == '?'):
-					continue
+def parse_connections(filename, db) -> ConnectionIngestStats:
+	"""Add connections from CSV file to their episodes, warning about any rows that were rejected
 
-				if strength not in ['0', '1']:
-					warn("Chapter strength not 0 or 1: book %i, chapter %s, strength %s" % (book_num, chap_name, strength))
-					continue
-				strength = int(strength)
+	:return: counts of rows & connections
+	"""
 
-				# Make sure chapter name is in the list of chapters!
-				chapter = db.find_chapter(chap_name, book_num)
+	stats = ConnectionIngestStats()
 
-				if not chapter:
-					warn("Chapter not found: book %i, chapter %s, notes %s" % (book_num, chap_name, notes))
+	warn_rejected_connections(ingest_connections(filename, db, stats), stats)
 
-				season = find_unique(db.seasons, lambda s: s.number == seas_num)
-				episode = find_unique(season.episodes, lambda ep: ep.number_in_season == ep_num_in_season)
+	debug_print(repr(stats))
 
-				connection = Connection(
-					episode=episode,
-					chapter=chapter,
-					strength=strength,
-					major=major,
-					notes=notes,
-				)
+	return stats
 
-				episode.book_connections.append(connection)
 
-	debug_print(repr(conn_list[0:10]))
+def warn_rejected_connections(rejected_rows: Iterator[RejectedRow], stats: ConnectionIngestStats):
+	"""Consume ingest_connections() iterator, warning about rejected rows (only individually up to a limit)"""
 
-	return conn_list
+	# Count rows as they are yielded - stats.rejected already includes the rest of the current batch
+	num_warned = 0
 
+	for rejected_row in rejected_rows:
+		if num_warned < _max_rejected_row_warnings:
+			warn('Rejected connection: %s' % rejected_row)
+			num_warned += 1
 
-def do_parsing(dir='input') -> DB:
+	if stats.rejected > num_warned:
+		warn('...and %i more rejected connections' % (stats.rejected - num_warned))
 
-	books_filename = os.path.join(dir, 'books.csv')
-	chapter_filename = os.path.join(dir, 'chapters.csv')
-	combined_filename = os.path.join(dir, 'combined.txt')
-	episode_filename = os.path.join(dir, 'episodes.csv')
-	connections_filename = os.path.join(dir, 'connections.csv')
+
+def print_connection_stats(stats: ConnectionIngestStats):
+	print("%i episode-chapter connections (%i rows: %i without chapter, %i rejected)" % (
+		stats.connections, stats.rows, stats.skipped, stats.rejected))
+
+
+def get_input_filenames(dir='input') -> List[str]:
+	"""
+	:return: all input files, in the order they are parsed
+	"""
+	return [
+		os.path.join(dir, 'books.csv'),
+		os.path.join(dir, 'chapters.csv'),
+		os.path.join(dir, 'combined.txt'),
+		os.path.join(dir, 'episodes.csv'),
+		os.path.join(dir, 'connections.csv'),
+	]
+
+
+def do_parsing(dir='input', build_columnar=False, connections=True) -> DB:
+	"""
+	:param dir: input directory
+	:param build_columnar: if True, will also build columnar connections (requires NumPy)
+	:param connections: if False, connections file will not be parsed (e.g. so that it can be streamed with
+	ingest_connections instead)
+	"""
+
+	books_filename, chapter_filename, combined_filename, episode_filename, connections_filename = \
+		get_input_filenames(dir)
 
 	db = DB()
 
 	print("Processing books: %s" % books_filename)
-	db.books = parse_books(books_filename)
+	with profiling.phase('parse_books'):
+		for book in parse_books(books_filename):
+			db.add_book(book)
 
 	print("Processing chapters: %s" % chapter_filename)
-	chapter_list = parse_chapters(chapter_filename, db.books)
+	with profiling.phase('parse_chapters'):
+		chapter_list = parse_chapters(chapter_filename, db)
 
 	print("Processing combined order: %s" % combined_filename)
-	combined_book = parse_combined_order(combined_filename, chapter_list, db.books)
+	with profiling.phase('parse_combined_order'):
+		combined_book = parse_combined_order(combined_filename, chapter_list, db.books)
 
 	print(len(combined_book.chapters), "chapters in books 4+5")
 
-	db.books.insert(5, combined_book)
+	db.add_book(combined_book, position=5)
 
 	print("")
 	print("%i chapters in %i books" % (len(chapter_list), len(db.books)))
@@ -277,14 +458,24 @@ def do_parsing(dir='input') -> DB:
 	print("")
 
 	print("Processing episodes: %s" % episode_filename)
-	episodes, db.seasons = parse_episodes(episode_filename)
+	with profiling.phase('parse_episodes'):
+		episodes = parse_episodes(episode_filename, db)
 	print("%i episodes, %i seasons" % (len(episodes), len(db.seasons)))
 
+	if not connections:
+		return db
+
 	print("")
 
 	print("Processing connections: %s" % connections_filename)
-	conn_list = parse_connections(connections_filename, db)
-	print("%i episode-chapter connections" % len(conn_list))
+	with profiling.phase('parse_connections'):
+		conn_stats = parse_connections(connections_filename, db)
+	print_connection_stats(conn_stats)
+
+	if build_columnar:
+		print("Building columnar connections")
+		with profiling.phase('build_columnar'):
+			db.columnar = columnar.ColumnarConnections(db)
 
 	return db
 
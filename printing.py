@@ -31,14 +31,26 @@ A note from the author:
 
 from utils import *
 from book_show_types import *
-from typing import Iterable, Optional
+import profiling
+import templates
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+import concurrent.futures
+import functools
 import os.path
+import zlib
+
+# brotli is optional - only needed for brotli-compressed output
+try:
+	import brotli
+except ImportError:
+	brotli = None
 
 
 # Darken every n cells
 _n_stripe = 5
 
-_table_line = '<!--table-->'
+_table_slot = 'table'  # i.e. <!--table--> line in template
 
 _top_left_box = '<img src="imgs/cornerbox.png">'
 
@@ -53,6 +65,28 @@ _max_chap_name_length = 15
 
 _use_roman_numerals_for_season_nums = True
 
+# Classes that compact tables put on body rows instead of on each cell (see get_compact_css)
+_compact_row_classes = {
+	"s": "rs",
+	"tb": "rtb",
+	"bb": "rbb",
+}
+
+# CSS for the classes that compact tables don't put on body cells - must match table.css
+_compact_class_css = {
+	"s": "background-color: #e6e6e6;",
+	"lb": "border-left: 1px solid #000;",
+	"rb": "border-right: 1px solid #000;",
+	"tb": "border-top: 1px solid #000;",
+	"bb": "border-bottom: 1px solid #000;",
+}
+
+# Supported compression for streamed output, and extension to add to filename
+compression_extensions = {
+	'gzip': '.gz',
+	'br': '.br',
+}
+
 
 class FileWriter:
 
@@ -62,59 +96,267 @@ class FileWriter:
 	# Windows EOL
 	eol = "\r\n"
 
-	def __init__(self, *files):
+	def __init__(self, *files, buffered=False):
+		"""
+		:param files: files to write to; everything written goes to all of them
+		:param buffered: if True, text is collected in memory and only written to files on flush(), as a single write
+		per file. If using multiple buffered writers on the same file, make sure to flush before switching writers
+		(using the writer as a context manager will flush on exit).
+		"""
 		self.files = files
+		self.buffered = buffered
+		self._buffer = []
+		self._indentations = {0: ''}
 
-	def op(self, text: str, indent=0):
-		for file in self.files:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.flush()
+
+	def _indentation(self, indent: int) -> str:
+		indentation = self._indentations.get(indent)
+		if indentation is None:
 			indentation = self.tab * indent
-			file.write(indentation + text)
+			self._indentations[indent] = indentation
+		return indentation
+
+	def op(self, text: str, indent=0):
+		if indent:
+			text = self._indentation(indent) + text
+
+		if self.buffered:
+			self._buffer.append(text)
+		else:
+			for file in self.files:
+				file.write(text)
 
 	def opl(self, text: str, indent=0):
 		self.op(text + self.eol, indent=indent)
 
+	def take_buffer(self) -> str:
+		"""Remove and return buffered text, without writing it"""
+		text = ''.join(self._buffer)
+		self._buffer = []
+		return text
+
+	def flush(self):
+		"""Write any buffered text to all files"""
+		if not self._buffer:
+			return
+
+		text = self.take_buffer()
+
+		for file in self.files:
+			file.write(text)
+
 
 def is_chap_name_empty(chap_name: str):
 	x = ''.join(ch for ch in chap_name if ch.isalnum())
 	return x == ''
 
 
-def print_html_header(writer: FileWriter, in_file):
-	line = ''
-	while _table_line not in line:
-		line = in_file.readline()
+def print_html_header(writer: FileWriter, template: templates.Template):
+	"""Print template up to and including the table slot"""
+	writer.op(template.split_at(_table_slot)[0])
 
-		if not line.endswith('\n'):
-			raise ValueError('Error: line %s not found' % _table_line)
 
-		writer.op(line)
-
-
-def print_html_footer(writer: FileWriter, in_file):
-	while True:
-		line = in_file.readline()
-		if not line.endswith('\n'):
-			break
-		writer.op(line)
+def print_html_footer(writer: FileWriter, template: templates.Template):
+	"""Print template after the table slot"""
+	writer.op(template.split_at(_table_slot)[1])
 
 
 def is_striped(
 		episode: Optional[Episode]=None,
 		chapter: Optional[Chapter]=None,
-		book: Optional[Book]=None):
+		chapter_position: Optional[int]=None):
+	"""
+	:param episode:
+	:param chapter:
+	:param chapter_position: position of chapter within the book it is displayed in (0-indexed); must be given for
+	combined books, as then it won't match chapter.number_in_book
+	"""
 
 	if episode is not None and (episode.number_in_season % _n_stripe == 1):
 		return True
 
-	if chapter is not None:
-		if book is not None:
-			return book.chapters.index(chapter) % _n_stripe == 0
-		else:
-			return chapter.number_in_book % _n_stripe == 1
+	if chapter_position is not None:
+		return chapter_position % _n_stripe == 0
+	elif chapter is not None:
+		return chapter.number_in_book % _n_stripe == 1
 	else:
 		return False
 
 
+@dataclass(frozen=True)
+class EpisodeRowStyle:
+	"""The parts of a body cell's classes that depend only on the episode row"""
+	border_classes: Tuple[str, ...]  # "tb" and/or "bb", if episode is first or last in season
+	striped: bool
+
+
+def get_episode_row_style(episode: Episode) -> EpisodeRowStyle:
+
+	border_classes = []
+
+	if episode.number_in_season == 1:
+		border_classes.append("tb")
+
+	if episode.number_in_season == len(episode.season.episodes):
+		border_classes.append("bb")
+
+	return EpisodeRowStyle(border_classes=tuple(border_classes), striped=is_striped(episode=episode))
+
+
+@dataclass(frozen=True)
+class ChapterColumn:
+	"""Everything about a chapter column that is the same for every row, so it only needs to be determined once"""
+	book: Book  # Note that this may not match chapter.book for combined books
+	chapter: Chapter
+	position: int  # Position of chapter within book.chapters (0-indexed)
+	base_classes: List[str]  # Book classes
+	border_classes: List[str]  # "lb" and/or "rb", if chapter is first or last in book
+	striped: bool
+
+	# Cache of body cell opening tags, by row style
+	# There are only a few row styles, so each column only ever formats a handful of these
+	_cell_open_tags: Dict = field(default_factory=dict, repr=False, compare=False)
+
+	def get_cell_open_tag(self, row_style: EpisodeRowStyle) -> str:
+		tag = self._cell_open_tags.get(row_style)
+
+		if tag is None:
+			classes = self.base_classes + list(row_style.border_classes) + self.border_classes
+
+			if self.striped or row_style.striped:
+				classes.append("s")
+
+			tag = '<td class="%s">' % ' '.join(classes)
+			self._cell_open_tags[row_style] = tag
+
+		return tag
+
+
+def get_chapter_columns(book: Book) -> List[ChapterColumn]:
+
+	if not book.is_combined() and any([chapter.book is not book for chapter in book.chapters]):
+		warn('Book does not match chapter.book for non-combined book!')
+
+	columns = []
+	last_position = len(book.chapters) - 1
+
+	for position, chapter in enumerate(book.chapters):
+
+		if book.is_combined():
+			base_classes = ["b%i" % book.number, "b%ico" % chapter.book.number]
+		else:
+			base_classes = ["b%i" % chapter.book.number]
+
+		border_classes = []
+
+		if position == 0:
+			border_classes.append("lb")
+
+		if position == last_position:
+			border_classes.append("rb")
+
+		columns.append(ChapterColumn(
+			book=book,
+			chapter=chapter,
+			position=position,
+			base_classes=base_classes,
+			border_classes=border_classes,
+			striped=is_striped(chapter_position=position),
+		))
+
+	return columns
+
+
+def get_all_chapter_columns(books: Iterable[Book]) -> Dict[int, List[ChapterColumn]]:
+	"""
+	:return: dict of book number -> list of columns for that book
+	"""
+	return {book.number: get_chapter_columns(book) for book in books}
+
+
+def get_compact_cell_classes(
+		books: Iterable[Book],
+		columns: Dict[int, List[ChapterColumn]]) -> List[Tuple[str, List[str]]]:
+	"""
+	:return: for each body cell in a row, in order: (book class, list of other classes that depend only on column)
+	"""
+
+	cells = []
+
+	for book in books:
+		cells.append(("b%ic" % book.number, ["lb", "rb"]))
+
+		for column in columns[book.number]:
+			classes = list(column.border_classes)
+			if column.striped:
+				classes.append("s")
+			cells.append((column.base_classes[0], classes))
+
+	return cells
+
+
+def get_compact_css(books: Iterable[Book], columns: Dict[int, List[ChapterColumn]]) -> str:
+	"""Get CSS for a compact table, where body cells have no classes
+
+	Instead, classes that depend on the row go on the <tr> (see get_episode_row_classes), and cells are styled & hidden
+	by their position in the row. Book columns are hidden by adding "h" + book class to the table (e.g. "hb1" hides
+	everything that has class "b1" in the full table), which got.js does when it shows & hides classes.
+	"""
+
+	cells = get_compact_cell_classes(books, columns)
+	num_cells = len(cells)
+
+	lines = []
+
+	for cls, row_cls in _compact_row_classes.items():
+		lines.append('#maintable.compact tr.%s > td { %s }' % (row_cls, _compact_class_css[cls]))
+
+	# Title cells at the start of rows vary (season title only has a cell in the first row), so count from the end
+	positions = {}
+	book_positions = {}
+
+	for idx, (book_class, classes) in enumerate(cells):
+		position = num_cells - idx
+
+		for cls in classes:
+			positions.setdefault(cls, []).append(position)
+
+		book_positions.setdefault(book_class, []).append(position)
+
+	for cls, cls_positions in positions.items():
+		selectors = ['#maintable.compact td:nth-last-child(%i)' % position for position in cls_positions]
+		lines.append('%s { %s }' % (','.join(selectors), _compact_class_css[cls]))
+
+	# Each book's cells are contiguous, so can be hidden as a range
+	for book_class, cls_positions in book_positions.items():
+		lines.append(
+			'#maintable.h%s td:nth-last-child(n+%i):nth-last-child(-n+%i) { display: none; }' % (
+				book_class, min(cls_positions), max(cls_positions)))
+
+	return ''.join([line + FileWriter.eol for line in lines])
+
+
+def get_compact_initial_hide_classes(books: Iterable[Book]) -> List[str]:
+	"""
+	:return: classes for compact table to hide the same book columns that table.css hides to begin with (collapsed
+	books, and combined books)
+	"""
+
+	classes = []
+
+	for book in books:
+		if book.is_combined():
+			classes.append("hb%i" % book.number)
+		classes.append("hb%ic" % book.number)
+
+	return classes
+
+
 def print_book_title_cells(writer: FileWriter, book: Book):
 
 	book_name = htmlize_string(book.name)
@@ -154,39 +396,28 @@ def print_all_book_title_cells(writer: FileWriter, books: Iterable[Book]):
 		print_book_title_cells(writer, book)
 
 
-def print_chapter_title_cell(writer: FileWriter, book: Book, chapter: Chapter):
-	"""
-	:param writer:
-	:param book: Note that this may not match chapter.book for combined books
-	:param chapter:
-	"""
-
-	if not book.is_combined() and book is not chapter.book:
-		warn('Book does not match chapter.book for non-combined book!')
-
-	# For "?" chapters after TWOW preview chaps
-	chap_name_isnt_real = is_chap_name_empty(chapter.name)
-
+def get_chapter_display_name(column: ChapterColumn) -> str:
 	# if name longer than ~15 characters, abbreviate
 	# If we're in combined section, prepend book number to chapter
 	# Want real book number, not fake combined book number, so use chapter.book.number rather than book.number
-	chap_name_to_display = abbrev_string(
-		chapter.name,
+	return abbrev_string(
+		column.chapter.name,
 		_max_chap_name_length,
-		prefix=str(chapter.book.number) if book.is_combined() else None)
+		prefix=str(column.chapter.book.number) if column.book.is_combined() else None)
 
-	if book.is_combined():
-		classes = ["cn", "b%i" % book.number, "b%ico" % chapter.book.number, "bb"]
-	else:
-		classes = ["cn", "b%i" % chapter.book.number, "bb"]
 
-	if chapter is book.chapters[0]:
-		classes.append("lb")
+def print_chapter_title_cell(writer: FileWriter, column: ChapterColumn):
+
+	chapter = column.chapter
+
+	# For "?" chapters after TWOW preview chaps
+	chap_name_isnt_real = is_chap_name_empty(chapter.name)
+
+	chap_name_to_display = get_chapter_display_name(column)
 
-	if chapter is book.chapters[-1]:
-		classes.append("rb")
+	classes = ["cn"] + column.base_classes + ["bb"] + column.border_classes
 
-	if is_striped(chapter=chapter, book=book):
+	if column.striped:
 		classes.append("s")
 
 	if chap_name_isnt_real:
@@ -202,10 +433,14 @@ def print_chapter_title_cell(writer: FileWriter, book: Book, chapter: Chapter):
 			' '.join(classes), chapter.name, classes_inner, chap_name_to_display), indent=1)
 
 
-def print_all_chapter_title_cells(writer: FileWriter, books: Iterable[Book]):
+def print_all_chapter_title_cells(
+		writer: FileWriter,
+		books: Iterable[Book],
+		columns: Dict[int, List[ChapterColumn]]):
+
 	for book in books:
-		for chapter in book.chapters:
-			print_chapter_title_cell(writer, book, chapter)
+		for column in columns[book.number]:
+			print_chapter_title_cell(writer, column)
 
 
 def print_connection(
@@ -235,88 +470,54 @@ def print_connection(
 def print_book_summary_cell_for_episode(
 		writer: FileWriter,
 		episode: Episode,
+		row_style: EpisodeRowStyle,
 		book: Book,
-		connections: Iterable[Connection]):
+		conn_index: ConnectionIndex,
+		compact=False):
 
-	classes = ["b%ic" % book.number, "lb", "rb"]
+	if compact:
+		# Classes come from the row & the table's compact CSS instead (see get_compact_css)
+		writer.op('<td>')
 
-	if episode.number_in_season == 1:
-		classes.append("tb")
-
-	if episode.number_in_season == len(episode.season.episodes):
-		classes.append("bb")
+	else:
+		classes = ["b%ic" % book.number, "lb", "rb"] + list(row_style.border_classes)
 
-	if is_striped(episode=episode):
-		classes.append("s")
+		if row_style.striped:
+			classes.append("s")
 
-	writer.op('<td class="%s">' % ' '.join(classes), indent=1)
+		writer.op('<td class="%s">' % ' '.join(classes), indent=1)
 
-	if book.is_combined():
-		ep_book_connections = [
-			item for item in connections
-			if (item.episode.number == episode.number) and (item.chapter.book in book.combined_books)
-		]
-	else:
-		ep_book_connections = [
-			item for item in connections
-			if (item.episode.number == episode.number) and (item.chapter.book is book)
-		]
+	strength = conn_index.get_book_strength(episode, book)
 
-	if ep_book_connections:
-		print_connection(writer, is_strong_connection=any([item.strength for item in ep_book_connections]))
+	if strength is not None:
+		print_connection(writer, is_strong_connection=bool(strength))
 
-	writer.opl("</td>")
+	# End tag is optional in HTML
+	if not compact:
+		writer.opl("</td>")
 
 
 def print_episode_chapter_cell(
 		writer: FileWriter,
 		episode: Episode,
-		book: Book,
-		chapter: Chapter,
-		debug_print_this_line=False):
-	"""
-	:param writer:
-	:param episode:
-	:param book: Note that this may not match chapter.book for combined books
-	:param chapter:
-	:param debug_print_this_line:
-	"""
+		row_style: EpisodeRowStyle,
+		column: ChapterColumn,
+		conn_index: ConnectionIndex,
+		debug_print_this_line=False,
+		compact=False):
 
-	if not book.is_combined() and book is not chapter.book:
-		warn('Book does not match chapter.book for non-combined book!')
+	chapter = column.chapter
 
 	if debug_print_this_line:
 		debug_print("Book %i, Chapter %i" % (chapter.book.number, chapter.number_in_book))
-
-	if not book.is_combined():
-		classes = ["b%i" % chapter.book.number]
-	else:
-		classes = ["b%i" % book.number, "b%ico" % chapter.book.number]
-
-	if episode.number_in_season == 1:
-		classes.append("tb")
-
-	if episode.number_in_season == len(episode.season.episodes):
-		classes.append("bb")
-
-	if chapter is book.chapters[0]:
-		classes.append("lb")
-
-	if chapter is book.chapters[-1]:
-		classes.append("rb")
-
-	if is_striped(episode=episode, chapter=chapter, book=book):
-		classes.append("s")
-
-	if debug_print_this_line:
-		if 'lb' in classes:
+		if 'lb' in column.border_classes:
 			debug_print('left border')
-		if 'rb' in classes:
+		if 'rb' in column.border_classes:
 			debug_print('right border')
 
-	writer.op('<td class="%s">' % ' '.join(classes))
+	writer.op('<td>' if compact else column.get_cell_open_tag(row_style))
 
-	matching_connections = [item for item in episode.book_connections if item.chapter.number == chapter.number]
+	matching_connections = conn_index.get_connections(episode, chapter)
 
 	if matching_connections:
 
@@ -328,14 +529,18 @@ def print_episode_chapter_cell(
 		notes = '; '.join([c.notes for c in matching_connections if c.notes])
 		print_connection(writer, max([c.strength for c in matching_connections]), notes, pov=chapter.pov)
 
-	writer.op('</td>')
+	if not compact:
+		writer.op('</td>')
 
 
 def print_episode_body_cells(
 		writer: FileWriter,
 		episode: Episode,
 		books: Iterable[Book],
-		debug_print_this_line=False):
+		columns: Dict[int, List[ChapterColumn]],
+		conn_index: ConnectionIndex,
+		debug_print_this_line=False,
+		compact=False):
 
 	debug_print("episode %i, %i connections: %s" % (
 		episode.number,
@@ -343,39 +548,47 @@ def print_episode_body_cells(
 		repr([item.chapter.number for item in episode.book_connections])))
 	debug_print(repr(episode.book_connections))
 
+	row_style = get_episode_row_style(episode)
+
 	for book in books:
 
 		if debug_print_this_line:
 			debug_print('')
 			debug_print('Book %i start' % book.number)
 
-		print_book_summary_cell_for_episode(writer, episode, book, episode.book_connections)
+		print_book_summary_cell_for_episode(writer, episode, row_style, book, conn_index, compact=compact)
 
-		for chapter in book.chapters:
-			print_episode_chapter_cell(writer, episode, book, chapter, debug_print_this_line=debug_print_this_line)
+		for column in columns[book.number]:
+			print_episode_chapter_cell(
+				writer, episode, row_style, column, conn_index,
+				debug_print_this_line=debug_print_this_line,
+				compact=compact)
 
 
-def print_episode_title_cells(
-		writer: FileWriter,
-		episode: Episode,
-		hide_on_float: bool,
-		mirror: bool):
-	"""
-	:param writer:
-	:param episode:
-	:param hide_on_float: if True, will add "hideonfloat" class
-	:param mirror: if True, episode and season cells will be swapped (i.e. for print version right floating table)
-	"""
+# Not size-limited, as rows are rendered in the same order for every table, so an LRU cache smaller than the number of
+# episodes would never get a hit. Only holds 1 entry per episode (per reload - see clear_episode_title_cells_cache).
+@functools.lru_cache(maxsize=None)
+def _get_episode_title_cells(
+		season_number: int,
+		number_in_season: int,
+		num_episodes_in_season: int,
+		name: str,
+		striped: bool,
+		first_of_season: bool,
+		last_of_season: bool) -> Dict[Tuple[bool, bool], str]:
+	"""Render an episode's title cells for every combination of print_episode_title_cells options
 
-	opl = writer.opl
+	Everything that doesn't depend on the options is only rendered once. Arguments are everything the cells depend on,
+	so results can be shared by all tables in all documents (and still be correct if DB is reloaded).
 
-	first_of_season = episode is episode.season.episodes[0]
-	last_of_season = episode is episode.season.episodes[-1]
+	:return: dict of (hide_on_float, mirror) -> rendered cells
+	"""
+
+	w = FileWriter(buffered=True)
 
 	episode_classes = []  # Classes for both episode number and episode title
-	season_title_classes = ['seas%ititle' % episode.season.number]
 
-	if is_striped(episode=episode):
+	if striped:
 		episode_classes.append('s')
 
 	if first_of_season:
@@ -384,67 +597,99 @@ def print_episode_title_cells(
 	if last_of_season:
 		episode_classes.append("bb")
 
-	if hide_on_float:
-		episode_classes.append('hideonfloat')
-		season_title_classes.append('hideonfloat')
-
-	ep_num_classes = ['epnum'] + episode_classes
-	if mirror:
-		ep_num_classes.append('rb')
-
-	ep_title_classes = ['eptitle', 'lb' if mirror else 'rb'] + episode_classes
+	# Season title cell (apart from its opening tag)
 
-	season_title_classes = ' '.join(season_title_classes)
-	ep_num_classes = ' '.join(ep_num_classes)
-	ep_title_classes = ' '.join(ep_title_classes)
-
-	if mirror:
-		opl('<th class="%s"><div class="eptitleinside">%s</div></th>' % (ep_title_classes, episode.name), indent=1)
-		opl('<th class="%s">%i</th>' % (ep_num_classes, episode.number_in_season), indent=1)
+	season_cell_contents = ''
 
 	if first_of_season:
-		opl('<th rowspan="%i" class="seasontitle %s">' % (len(episode.season.episodes), season_title_classes), indent=1)
-
 		if _use_img_headers:
-			opl('<img src="imgs/s%ititle.png" alt="Season %i">' % (episode.season.number, episode.season.number))
+			w.opl('<img src="imgs/s%ititle.png" alt="Season %i">' % (season_number, season_number))
 		else:
 			if _use_roman_numerals_for_season_nums:
-				season_num_str = to_roman_numeral(episode.season.number)
+				season_num_str = to_roman_numeral(season_number)
 			else:
-				season_num_str = str(episode.season.number)
+				season_num_str = str(season_number)
 
-			opl('<div class="seasonnamerotate">', indent=2)
-			opl('<div class="seasonnameinside">Season %s</div>' % season_num_str, indent=3)
-			opl("</div>", indent=2)
+			w.opl('<div class="seasonnamerotate">', indent=2)
+			w.opl('<div class="seasonnameinside">Season %s</div>' % season_num_str, indent=3)
+			w.opl("</div>", indent=2)
 
-		opl("</th>", indent=1)
+		w.opl("</th>", indent=1)
 
-	if not mirror:
-		opl('<th class="%s">%i</th>' % (ep_num_classes, episode.number_in_season), indent=1)
-		opl('<th class="%s"><div class="eptitleinside">%s</div></th>' % (ep_title_classes, episode.name), indent=1)
+		season_cell_contents = w.take_buffer()
 
+	cells = {}
 
-def print_episode_row(
+	for hide_on_float in [False, True]:
+		for mirror in [False, True]:
+
+			variant_episode_classes = episode_classes + ['hideonfloat'] if hide_on_float else episode_classes
+			season_title_classes = 'seas%ititle hideonfloat' if hide_on_float else 'seas%ititle'
+
+			ep_num_classes = ['epnum'] + variant_episode_classes
+			if mirror:
+				ep_num_classes.append('rb')
+
+			ep_title_classes = ['eptitle', 'lb' if mirror else 'rb'] + variant_episode_classes
+
+			w.opl('<th class="%s">%i</th>' % (' '.join(ep_num_classes), number_in_season), indent=1)
+			ep_num_cell = w.take_buffer()
+
+			w.opl(
+				'<th class="%s"><div class="eptitleinside">%s</div></th>' % (' '.join(ep_title_classes), name), indent=1)
+			ep_title_cell = w.take_buffer()
+
+			if first_of_season:
+				w.opl('<th rowspan="%i" class="seasontitle %s">' % (
+					num_episodes_in_season, season_title_classes % season_number), indent=1)
+				w.op(season_cell_contents)
+			season_cell = w.take_buffer()
+
+			if mirror:
+				cells[(hide_on_float, mirror)] = ep_title_cell + ep_num_cell + season_cell
+			else:
+				cells[(hide_on_float, mirror)] = season_cell + ep_num_cell + ep_title_cell
+
+	return cells
+
+
+def clear_episode_title_cells_cache():
+	"""Free cached episode title cells, e.g. when DB is reloaded (cells of episodes that have since changed would never
+	be used again)"""
+	_get_episode_title_cells.cache_clear()
+
+
+def print_episode_title_cells(
 		writer: FileWriter,
 		episode: Episode,
-		books: Optional[Iterable[Book]],
-		is_body_section: bool,
-		is_end_section: bool):
+		hide_on_float: bool,
+		mirror: bool):
 	"""
 	:param writer:
 	:param episode:
-	:param books: must be given if print_body_cells
-	:param is_body_section:
-	:param is_end_section:
+	:param hide_on_float: if True, will add "hideonfloat" class
+	:param mirror: if True, episode and season cells will be swapped (i.e. for print version right floating table)
 	"""
 
-	if is_body_section and is_end_section:
-		raise ValueError('Cannot be both body section and end section!')
+	# The floating table, main table & print version right table all have the same title cells, other than these
+	# options, so they are only rendered once per episode
+	cells = _get_episode_title_cells(
+		episode.season.number,
+		episode.number_in_season,
+		len(episode.season.episodes),
+		episode.name,
+		is_striped(episode=episode),
+		episode is episode.season.episodes[0],
+		episode is episode.season.episodes[-1])
 
-	if is_body_section and not books:
-		warn('is_body_section given but books empty!')
+	writer.op(cells[(hide_on_float, mirror)])
 
-	# <tr>
+
+def get_episode_row_classes(episode: Episode, compact=False) -> str:
+	"""
+	:param episode:
+	:param compact: if True, will also include classes for the row's body cells (see get_compact_css)
+	"""
 
 	ep_row_classes = ['eprow']
 
@@ -460,7 +705,46 @@ def print_episode_row(
 
 	ep_row_classes.append(season_class)
 
-	writer.opl('<tr class="%s">' % ' '.join(ep_row_classes))
+	if compact:
+		row_style = get_episode_row_style(episode)
+
+		ep_row_classes += [_compact_row_classes[cls] for cls in row_style.border_classes]
+
+		if row_style.striped:
+			ep_row_classes.append(_compact_row_classes["s"])
+
+	return ' '.join(ep_row_classes)
+
+
+def print_episode_row(
+		writer: FileWriter,
+		episode: Episode,
+		books: Optional[Iterable[Book]],
+		is_body_section: bool,
+		is_end_section: bool,
+		columns: Optional[Dict[int, List[ChapterColumn]]]=None,
+		conn_index: Optional[ConnectionIndex]=None,
+		compact=False):
+	"""
+	:param writer:
+	:param episode:
+	:param books: must be given if print_body_cells
+	:param is_body_section:
+	:param is_end_section:
+	:param columns: must be given if print_body_cells
+	:param conn_index: must be given if print_body_cells
+	:param compact: if True, body cells will be printed without classes (see get_compact_css)
+	"""
+
+	if is_body_section and is_end_section:
+		raise ValueError('Cannot be both body section and end section!')
+
+	if is_body_section and not books:
+		warn('is_body_section given but books empty!')
+
+	# <tr>
+
+	writer.opl('<tr class="%s">' % get_episode_row_classes(episode, compact=(compact and is_body_section)))
 
 	# Season & episode title cells
 
@@ -469,24 +753,152 @@ def print_episode_row(
 	# Body cells
 
 	if is_body_section:
-		print_episode_body_cells(writer, episode, books, debug_print_this_line=(episode.number == 1))
+		print_episode_body_cells(
+			writer, episode, books, columns, conn_index,
+			debug_print_this_line=(episode.number == 1),
+			compact=compact)
+
+		if compact:
+			writer.opl('')
 
 	# </tr>
 
 	writer.opl("</tr>")
 
 
-def print_all_episode_rows(
-		writer: FileWriter,
+def iter_all_episode_rows(
 		seasons: Iterable[Season],
-		books: Iterable[Book]):
+		books: Iterable[Book],
+		columns: Dict[int, List[ChapterColumn]],
+		conn_index: ConnectionIndex,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		compact=False) -> Iterator[str]:
+	"""
+	:param seasons:
+	:param books:
+	:param columns:
+	:param conn_index:
+	:param rendered_rows: Optional cache of rendered rows, by episode number. Rows in here will be yielded as-is rather
+	than rendered; any other rows will be rendered and added to it.
+	:param compact: see print_episode_row
+	:return: iterator of rendered rows, 1 per episode
+	"""
+
+	writer = FileWriter(buffered=True)
 
 	for season in seasons:
 		for episode in season.episodes:
+
+			if rendered_rows is not None and episode.number in rendered_rows:
+				yield rendered_rows[episode.number]
+				continue
+
 			print_episode_row(
 				writer, episode, books,
 				is_body_section=True,
-				is_end_section=False)
+				is_end_section=False,
+				columns=columns,
+				conn_index=conn_index,
+				compact=compact)
+
+			row = writer.take_buffer()
+
+			if rendered_rows is not None:
+				rendered_rows[episode.number] = row
+
+			yield row
+
+
+def print_all_episode_rows(
+		writer: FileWriter,
+		seasons: Iterable[Season],
+		books: Iterable[Book],
+		columns: Dict[int, List[ChapterColumn]],
+		conn_index: ConnectionIndex,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		compact=False):
+	"""See iter_all_episode_rows"""
+	for row in iter_all_episode_rows(seasons, books, columns, conn_index, rendered_rows, compact):
+		writer.op(row)
+
+
+# State for process pool workers rendering episode rows, so DB only needs to be sent to each worker once, and each
+# worker only needs to build ConnectionIndex & columns once
+_row_worker_db = None
+_row_worker_conn_index = None
+_row_worker_columns = {}
+
+
+def _init_row_worker(db: DB):
+	global _row_worker_db, _row_worker_conn_index
+	_row_worker_db = db
+	_row_worker_conn_index = ConnectionIndex(db)
+	_row_worker_columns.clear()
+
+
+def _render_episode_rows(book_numbers: Tuple[int, ...], episode_numbers: List[int], compact: bool) -> Dict[int, str]:
+
+	books = [book for book in _row_worker_db.books if book.number in book_numbers]
+
+	if book_numbers not in _row_worker_columns:
+		_row_worker_columns[book_numbers] = get_all_chapter_columns(books)
+	columns = _row_worker_columns[book_numbers]
+
+	rendered_rows = {}
+	for episode_number in episode_numbers:
+		writer = FileWriter(buffered=True)
+		print_episode_row(
+			writer, _row_worker_db.find_episode_by_number(episode_number), books,
+			is_body_section=True,
+			is_end_section=False,
+			columns=columns,
+			conn_index=_row_worker_conn_index,
+			compact=compact)
+		rendered_rows[episode_number] = writer.take_buffer()
+
+	return rendered_rows
+
+
+def render_episode_rows_parallel(
+		db: DB,
+		books: List[Book],
+		jobs: int,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		compact=False) -> Dict[int, str]:
+	"""Render body rows across multiple processes
+
+	:param db:
+	:param books:
+	:param jobs: number of worker processes
+	:param rendered_rows: Optional cache of rendered rows, by episode number; rows already in here won't be rendered
+	:param compact: see print_episode_row
+	:return: rendered_rows, with all episodes' rows added (or a new dict, if rendered_rows was None)
+	"""
+
+	if rendered_rows is None:
+		rendered_rows = {}
+
+	episode_numbers = [
+		episode.number for season in db.seasons for episode in season.episodes
+		if episode.number not in rendered_rows]
+
+	if not episode_numbers:
+		return rendered_rows
+
+	# Several contiguous chunks per worker, so that one slow chunk doesn't hold everything up
+	num_chunks = min(len(episode_numbers), 4 * jobs)
+	chunk_size = -(-len(episode_numbers) // num_chunks)
+	chunks = [episode_numbers[idx:idx + chunk_size] for idx in range(0, len(episode_numbers), chunk_size)]
+
+	book_numbers = tuple(book.number for book in books)
+
+	with concurrent.futures.ProcessPoolExecutor(
+			max_workers=jobs, initializer=_init_row_worker, initargs=(db,)) as executor:
+		for chunk_rows in executor.map(
+				_render_episode_rows, [book_numbers] * len(chunks), chunks, [compact] * len(chunks)):
+			rendered_rows.update(chunk_rows)
+
+	return rendered_rows
 
 
 def print_floating_episode_list(writer: FileWriter, seasons: Iterable[Season]):
@@ -542,29 +954,60 @@ def print_right_floating_table(w: FileWriter, db: DB):
 	w.opl("</table>")
 
 
-def print_main_table(w: FileWriter, db: DB):
+def iter_main_table(
+		db: DB,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		books: Optional[List[Book]]=None,
+		jobs=1,
+		compact=False) -> Iterator[str]:
+	"""Render main table, in chunks - the table head, then 1 chunk per body row, then the end of the table
+
+	:param db:
+	:param rendered_rows: Optional cache of rendered body rows, by episode number (see print_all_episode_rows). Rows
+	depend on which books are in the table (and compact), so don't share this between different tables.
+	:param books: Books to include in table; if None, will use all of db.books
+	:param jobs: number of processes to render body rows with
+	:param compact: if True, body cells will have no classes, and be styled by CSS rules for their position instead
+	(see get_compact_css). Much smaller, but looks & behaves the same.
+	"""
 
-	w.opl('<table id="maintable">')
+	if books is None:
+		books = db.books
 
-	# thead
+	columns = get_all_chapter_columns(books)
 
-	w.opl('<thead>')
-	w.opl('<tr class="booktitlerow">')
+	w = FileWriter(buffered=True)
 
-	w.opl('<th colspan="3" rowspan="2" class="cornerbox hideonfloat"><div class="cornerboxdiv">%s</div></th>' %
-		  _top_left_box, indent=1)
+	with profiling.phase('main table head'):
 
-	print("Writing table chapter headers")
+		if compact:
+			w.opl('<style>')
+			w.op(get_compact_css(books, columns))
+			w.opl('</style>')
+			w.opl('<table id="maintable" class="%s">' % ' '.join(
+				['compact'] + get_compact_initial_hide_classes(books)))
+		else:
+			w.opl('<table id="maintable">')
 
-	print_all_book_title_cells(w, db.books)
+		# thead
 
-	w.opl('</tr>')
-	w.opl('<tr>')
+		w.opl('<thead>')
+		w.opl('<tr class="booktitlerow">')
 
-	print_all_chapter_title_cells(w, db.books)
+		w.opl('<th colspan="3" rowspan="2" class="cornerbox hideonfloat"><div class="cornerboxdiv">%s</div></th>' %
+			  _top_left_box, indent=1)
 
-	w.opl('</tr>')
-	w.opl('</thead>')
+		print("Writing table chapter headers")
+
+		print_all_book_title_cells(w, books)
+
+		w.opl('</tr>')
+		w.opl('<tr>')
+
+		print_all_chapter_title_cells(w, books, columns)
+
+		w.opl('</tr>')
+		w.opl('</thead>')
 
 	# tbody
 
@@ -574,7 +1017,18 @@ def print_main_table(w: FileWriter, db: DB):
 
 	w.opl('<tbody>')
 
-	print_all_episode_rows(w, db.seasons, db.books)
+	yield w.take_buffer()
+
+	# If the consumer writes each row as it goes (i.e. when streaming), this includes the time to write them
+	with profiling.phase('main table body'):
+
+		if jobs > 1:
+			rendered_rows = render_episode_rows_parallel(db, books, jobs, rendered_rows, compact)
+
+		yield from iter_all_episode_rows(db.seasons, books, columns, ConnectionIndex(db), rendered_rows, compact)
+
+	if profiling.is_enabled():
+		count_main_table_body_cells(db.seasons, books, columns)
 
 	w.opl('</tbody>')
 
@@ -586,42 +1040,262 @@ def print_main_table(w: FileWriter, db: DB):
 
 	w.opl('</table>')
 
+	yield w.take_buffer()
+
+
+def count_main_table_body_cells(
+		seasons: Iterable[Season],
+		books: Iterable[Book],
+		columns: Dict[int, List[ChapterColumn]]):
+	"""Add number of rows & cells in main table body to profiling counters (without having to count them as they are
+	rendered)"""
+
+	num_episodes = sum([len(season.episodes) for season in seasons])
+	num_seasons = len([season for season in seasons if season.episodes])
+	cells_per_row = sum([1 + len(columns[book.number]) for book in books])
+
+	# Each row has episode number & title cells, plus season title cell in first row of season
+	profiling.count('main table body rows', num_episodes)
+	profiling.count('main table body cells', num_episodes * (2 + cells_per_row) + num_seasons)
+
+
+def print_main_table(
+		w: FileWriter,
+		db: DB,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		books: Optional[List[Book]]=None,
+		jobs=1,
+		compact=False):
+	"""See iter_main_table"""
+	for chunk in iter_main_table(db, rendered_rows, books, jobs, compact):
+		w.op(chunk)
+
+
+@dataclass(frozen=True)
+class OutputDocument:
+	template_filename: str
+	output_filename: str
+	is_print_version: bool
+
+	# Query string for page to use if it is opened without one (print version only)
+	static_query: Optional[str] = None
+
+
+def get_output_documents(
+		input_dir='input',
+		output_dir='output',
+		output_print_dir='output-print') -> List[OutputDocument]:
+	return [
+		OutputDocument(
+			template_filename=os.path.join(input_dir, 'template.html'),
+			output_filename=os.path.join(output_dir, 'bookshow.html'),
+			is_print_version=False),
+		OutputDocument(
+			template_filename=os.path.join(input_dir, 'template-print.html'),
+			output_filename=os.path.join(output_print_dir, 'bookshow_print.html'),
+			is_print_version=True),
+	]
+
+
+def iter_main_table_div(
+		db: DB,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		books: Optional[List[Book]]=None,
+		jobs=1,
+		compact=False) -> Iterator[str]:
+	"""Same as iter_main_table, but wrapped in its div, which is what goes in the output documents"""
+	yield '<div id="maintablediv">' + FileWriter.eol
+	yield from iter_main_table(db, rendered_rows, books, jobs, compact)
+	yield '</div> <!-- /maintablediv -->' + FileWriter.eol
+
+
+def render_main_table(
+		db: DB,
+		rendered_rows: Optional[Dict[int, str]]=None,
+		books: Optional[List[Book]]=None,
+		jobs=1,
+		compact=False) -> str:
+	"""Render main table div (which is the same in all output documents) to a string
+
+	:param db:
+	:param rendered_rows: see iter_main_table
+	:param books: see iter_main_table
+	:param jobs: see iter_main_table
+	:param compact: see iter_main_table
+	"""
+	return ''.join(iter_main_table_div(db, rendered_rows, books, jobs, compact))
+
+
+def iter_document(doc: OutputDocument, db: DB, main_table: Iterable[str]) -> Iterator[str]:
+	"""Render a complete HTML document, in chunks
+
+	:param doc:
+	:param db:
+	:param main_table: chunks of main table div - either already rendered (e.g. [render_main_table(db)]), or rendered as
+	it goes (e.g. iter_main_table_div(db))
+	"""
+
+	w = FileWriter(buffered=True)
+
+	template = templates.load_template(doc.template_filename, required_slots=[_table_slot])
+
+	with profiling.phase('header', file=doc.output_filename):
+
+		print_html_header(w, template)
+
+		if doc.static_query is not None:
+			w.opl('<script>var staticQuery = "%s";</script>' % doc.static_query)
+
+		w.opl('<div id="tablediv" class="cpov spoiler_b0">')
+
+	if not doc.is_print_version:
+		with profiling.phase('floating table', file=doc.output_filename):
+			print_floating_table(w, db)
+
+	yield w.take_buffer()
+
+	yield from main_table
 
-def do_printing(db: DB, input_dir='input', output_dir='output', output_print_dir='output-print'):
+	if doc.is_print_version:
+		with profiling.phase('floating table', file=doc.output_filename):
+			print_right_floating_table(w, db)
 
-	html_template_filename_inter = os.path.join(input_dir, 'template.html')
-	html_template_filename_print = os.path.join(input_dir, 'template-print.html')
-	output_filename_inter = os.path.join(output_dir, 'bookshow.html')
-	output_filename_print = os.path.join(output_print_dir, 'bookshow_print.html')
+	with profiling.phase('footer', file=doc.output_filename):
 
-	print('Opening files')
-	with \
-			open(html_template_filename_inter, 'r') as in_file_interactive, \
-			open(html_template_filename_print, 'r') as in_file_print, \
-			open(output_filename_inter, 'w') as out_file_interactive, \
-			open(output_filename_print, 'w') as out_file_print:
+		w.opl('</div> <!-- /tablediv -->')
 
-		writer_interactive = FileWriter(out_file_interactive)
-		writer_print_version = FileWriter(out_file_print)
-		writer_both = FileWriter(out_file_print, out_file_interactive)
+		print_html_footer(w, template)
 
-		print('Writing HTML Header')
-		print_html_header(writer_interactive, in_file_interactive)
-		print_html_header(writer_print_version, in_file_print)
+	yield w.take_buffer()
 
-		writer_both.opl('<div id="tablediv" class="cpov spoiler_b0">')
 
-		print('Writing floating table')
-		print_floating_table(writer_interactive, db)
+def write_document(doc: OutputDocument, db: DB, main_table: str):
+	"""Write a complete HTML document, around an already-rendered main table div"""
+	with profiling.phase('write document', file=doc.output_filename):
+		with open(doc.output_filename, 'w') as out_file, FileWriter(out_file, buffered=True) as w:
+			for chunk in iter_document(doc, db, [main_table]):
+				w.op(chunk)
+
+	profiling.count_file_size(doc.output_filename)
+
+
+def iter_document_bytes(
+		doc: OutputDocument,
+		db: DB,
+		compression: Optional[str]=None,
+		compact=False) -> Iterator[bytes]:
+	"""Render a complete HTML document as UTF-8, rendering the main table as it goes
+
+	Memory use doesn't depend on the size of the table, as only 1 row is held at a time. Chunks are suitable for
+	writing straight to a file or sending as a chunked HTTP response.
+
+	:param doc:
+	:param db:
+	:param compression: None, or one of compression_extensions (brotli requires the brotli package)
+	:param compact: see iter_main_table
+	"""
+
+	if compression is None:
+		compress = finish = None
+	elif compression == 'gzip':
+		compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16 + MAX_WBITS means gzip format
+		compress, finish = compressor.compress, compressor.flush
+	elif compression == 'br':
+		if brotli is None:
+			raise ImportError('brotli package is required for brotli compression')
+		compressor = brotli.Compressor()
+		compress, finish = compressor.process, compressor.finish
+	else:
+		raise ValueError('Unknown compression: %s' % compression)
+
+	for chunk in iter_document(doc, db, iter_main_table_div(db, compact=compact)):
+		data = chunk.encode('utf-8')
 
-		writer_both.opl('<div id="maintablediv">')
-		print_main_table(writer_both, db)
-		writer_both.opl('</div> <!-- /maintablediv -->')
+		if compress is not None:
+			data = compress(data)
 
-		print_right_floating_table(writer_print_version, db)
+		if data:
+			yield data
 
-		writer_both.opl('</div> <!-- /tablediv -->')
+	if finish is not None:
+		yield finish()
 
-		print('Writing HTML footer')
-		print_html_footer(writer_interactive, in_file_interactive)
-		print_html_footer(writer_print_version, in_file_print)
+
+def stream_document(doc: OutputDocument, db: DB, compression: Optional[str]=None, compact=False):
+	"""Write a complete HTML document, rendering the main table as it goes (see iter_document_bytes)
+
+	If compressed, the appropriate extension (e.g. ".gz") will be added to the output filename
+	"""
+
+	filename = doc.output_filename
+	if compression is not None:
+		filename += compression_extensions[compression]
+
+	with profiling.phase('stream document', file=filename):
+		with open(filename, 'wb') as out_file:
+			for data in iter_document_bytes(doc, db, compression, compact):
+				out_file.write(data)
+
+	profiling.count_file_size(filename)
+
+
+def do_printing(
+		db: DB,
+		input_dir='input',
+		output_dir='output',
+		output_print_dir='output-print',
+		rendered_rows: Optional[Dict[int, str]]=None,
+		parallel=True,
+		jobs=1,
+		stream=False,
+		compression: Optional[str]=None,
+		compact=False):
+	"""
+	:param db:
+	:param input_dir:
+	:param output_dir:
+	:param output_print_dir:
+	:param rendered_rows: Optional cache of rendered body rows, by episode number (see print_all_episode_rows)
+	:param parallel: if True, output documents will be written concurrently, in a thread pool
+	:param jobs: number of processes to render table body rows with
+	:param stream: if True, each document will be rendered as it is written instead, so memory use doesn't depend on
+	table size (but the table gets rendered once per document). rendered_rows, parallel & jobs are ignored.
+	:param compression: None, or one of compression_extensions; implies stream
+	:param compact: if True, will write compact main table (see iter_main_table)
+	"""
+
+	docs = get_output_documents(input_dir, output_dir, output_print_dir)
+
+	if stream or compression is not None:
+		for doc in docs:
+			print('Streaming HTML file: %s' % doc.output_filename)
+			stream_document(doc, db, compression, compact)
+		return
+
+	# Main table is by far the most work, and is identical in every document, so only render it once
+	main_table = render_main_table(db, rendered_rows, jobs=jobs, compact=compact)
+
+	write_documents([(doc, main_table) for doc in docs], db, parallel=parallel)
+
+
+def write_documents(docs_and_main_tables: List[Tuple[OutputDocument, str]], db: DB, parallel=True):
+	"""
+	:param docs_and_main_tables: list of (document, rendered main table for it)
+	:param db:
+	:param parallel: if True, documents will be written concurrently, in a thread pool
+	"""
+
+	print('Writing HTML files: %s' % ', '.join([doc.output_filename for doc, _ in docs_and_main_tables]))
+
+	if parallel:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=len(docs_and_main_tables)) as executor:
+			futures = [
+				executor.submit(write_document, doc, db, main_table)
+				for doc, main_table in docs_and_main_tables]
+
+			# Re-raise any exceptions from threads
+			for future in futures:
+				future.result()
+	else:
+		for doc, main_table in docs_and_main_tables:
+			write_document(doc, db, main_table)
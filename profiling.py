@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+@dataclass
+class PhaseRecord:
+	name: str
+	args: Dict
+	thread_id: int
+	start: float  # perf_counter() at start
+	wall: float = 0.0  # seconds
+	cpu: float = 0.0  # seconds of CPU time in the thread the phase ran in
+	allocated: int = 0  # net change in traced memory, in bytes
+	peak: int = 0  # peak traced memory during phase, above what it was at start, in bytes
+
+	# For working out peak with nested phases
+	_start_memory: int = field(default=0, repr=False)
+
+
+class Profiler:
+	"""Records wall time, CPU time & allocations of phases, plus counters
+
+	Allocations are measured with tracemalloc, which is started when the profiler is created. Phases running
+	concurrently in multiple threads will see each other's allocations. Worker processes are not profiled.
+	"""
+
+	def __init__(self):
+		self.phases = []  # type: List[PhaseRecord]
+		self.counters = {}  # type: Dict[str, int]
+		self._open_phases = []  # type: List[PhaseRecord]
+		self._lock = threading.Lock()
+		self._start = time.perf_counter()
+
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	def _update_peaks(self):
+		"""Update peaks of all open phases with peak since last update, and reset peak (must hold lock)"""
+		_, peak = tracemalloc.get_traced_memory()
+		for phase in self._open_phases:
+			phase.peak = max(phase.peak, peak - phase._start_memory)
+		tracemalloc.reset_peak()
+
+	@contextlib.contextmanager
+	def phase(self, name: str, **args):
+
+		record = PhaseRecord(name=name, args=args, thread_id=threading.get_ident(), start=0.0)
+
+		with self._lock:
+			self._update_peaks()
+			record._start_memory = tracemalloc.get_traced_memory()[0]
+			self._open_phases.append(record)
+
+		record.start = time.perf_counter()
+		start_cpu = time.thread_time()
+
+		try:
+			yield record
+		finally:
+			record.cpu = time.thread_time() - start_cpu
+			record.wall = time.perf_counter() - record.start
+
+			with self._lock:
+				self._update_peaks()
+				record.allocated = tracemalloc.get_traced_memory()[0] - record._start_memory
+				self._open_phases.remove(record)
+				self.phases.append(record)
+
+	def count(self, name: str, n=1):
+		with self._lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def print_summary(self):
+		"""Print totals for each phase name (in order each first started), then counters"""
+
+		totals = {}
+		for record in sorted(self.phases, key=lambda record: record.start):
+			total = totals.setdefault(record.name, {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'allocated': 0, 'peak': 0})
+			total['count'] += 1
+			total['wall'] += record.wall
+			total['cpu'] += record.cpu
+			total['allocated'] += record.allocated
+			total['peak'] = max(total['peak'], record.peak)
+
+		print('%-28s %6s %11s %11s %12s %12s' % ('Phase', 'Count', 'Wall (ms)', 'CPU (ms)', 'Alloc (KB)', 'Peak (KB)'))
+		for name, total in totals.items():
+			print('%-28s %6i %11.1f %11.1f %12.1f %12.1f' % (
+				name, total['count'], 1000.0 * total['wall'], 1000.0 * total['cpu'],
+				total['allocated'] / 1024.0, total['peak'] / 1024.0))
+
+		if self.counters:
+			print('')
+			for name, value in self.counters.items():
+				print('%-52s %14i' % (name, value))
+
+	def write_chrome_trace(self, filename: str):
+		"""Write phases in Chrome trace event format (open in chrome://tracing or Perfetto)"""
+
+		pid = os.getpid()
+
+		events = [
+			{
+				'name': record.name,
+				'ph': 'X',
+				'ts': 1e6 * (record.start - self._start),
+				'dur': 1e6 * record.wall,
+				'pid': pid,
+				'tid': record.thread_id,
+				'args': dict(record.args, cpu_ms=1000.0 * record.cpu, allocated=record.allocated, peak=record.peak),
+			}
+			for record in self.phases
+		]
+
+		end = 1e6 * (time.perf_counter() - self._start)
+		events += [
+			{'name': name, 'ph': 'C', 'ts': end, 'pid': pid, 'args': {name: value}}
+			for name, value in self.counters.items()
+		]
+
+		with open(filename, 'w') as f:
+			json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Current profiler, if profiling is enabled
+_profiler = None  # type: Optional[Profiler]
+
+# Returned by phase() when profiling is disabled, so that it costs next to nothing
+_null_phase = contextlib.nullcontext()
+
+
+def enable() -> Profiler:
+	global _profiler
+	_profiler = Profiler()
+	return _profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+	return _profiler
+
+
+def is_enabled() -> bool:
+	return _profiler is not None
+
+
+def phase(name: str, **args):
+	"""Context manager to record a phase, if profiling is enabled
+
+	:param name: phase name - phases with the same name are added together in the summary
+	:param args: extra info to include in trace (e.g. filename)
+	"""
+	if _profiler is None:
+		return _null_phase
+	return _profiler.phase(name, **args)
+
+
+def count(name: str, n=1):
+	"""Add to a counter, if profiling is enabled"""
+	if _profiler is not None:
+		_profiler.count(name, n)
+
+
+def count_file_size(filename: str):
+	"""Add size of a file that has been written to counters, if profiling is enabled"""
+	if _profiler is not None:
+		_profiler.count('bytes written: %s' % filename, os.path.getsize(filename))
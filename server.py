@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from book_show_types import *
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import email.utils
+import gzip
+import hashlib
+import mimetypes
+import os
+import os.path
+import time
+import urllib.parse
+import parsing
+import utils
+import printing
+import variants
+import json_export
+
+# brotli is optional - if not installed, responses will only be offered gzip-compressed
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+
+# Content types worth compressing
+_compressible_types = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+_max_request_header_size = 16 * 1024
+
+
+@dataclass(frozen=True)
+class Resource:
+	"""A response body, along with everything needed to serve it"""
+	body: bytes
+	content_type: str
+	etag: str
+	last_modified: float  # Unix timestamp
+
+	# Content-Encoding -> pre-compressed body
+	compressed: Dict[str, bytes] = field(default_factory=dict)
+
+
+def make_resource(body: bytes, content_type: str, last_modified: Optional[float]=None) -> Resource:
+	"""
+	:param body:
+	:param content_type:
+	:param last_modified: if None, will use current time
+	"""
+
+	compressed = {}
+	if content_type.startswith(_compressible_types):
+		compressed['gzip'] = gzip.compress(body, compresslevel=9)
+		if brotli is not None:
+			compressed['br'] = brotli.compress(body)
+
+	return Resource(
+		body=body,
+		content_type=content_type,
+		etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+		last_modified=time.time() if last_modified is None else last_modified,
+		compressed=compressed)
+
+
+class ChartServer:
+	"""HTTP server for the chart, which keeps parsed data & rendered pages in memory
+
+	URL paths are relative to the repository root, so the pages' relative links to assets work: the pages are at
+	/output/bookshow.html and /output-print/bookshow_print.html, and everything else is served from the output
+	directories. Print version query strings select pre-rendered variants. If streaming, the main pages are instead
+	rendered for each request, and sent as they are rendered.
+	"""
+
+	def __init__(
+			self,
+			db: DB,
+			load_db: Callable[[], DB],
+			input_dir='input',
+			output_dir='output',
+			output_print_dir='output-print',
+			jobs=1,
+			poll_interval=1.0,
+			compact=False,
+			stream=False):
+		"""
+		:param db: initial parsed data
+		:param load_db: function to (re)load DB when input files change
+		:param input_dir:
+		:param output_dir:
+		:param output_print_dir:
+		:param jobs: number of processes to render with
+		:param poll_interval: how often to check input files for changes, in seconds
+		:param compact: if True, will render compact main tables (see printing.iter_main_table)
+		:param stream: if True, main pages will be rendered for each request as they are sent (as chunked responses),
+		instead of kept in memory
+		"""
+
+		self.load_db = load_db
+		self.input_dir = input_dir
+		self.output_dir = output_dir
+		self.output_print_dir = output_print_dir
+		self.jobs = jobs
+		self.poll_interval = poll_interval
+		self.compact = compact
+		self.stream = stream
+
+		self.docs = printing.get_output_documents(input_dir, output_dir, output_print_dir)
+		self.variants = variants.parse_variant_matrix([])
+
+		# URL path -> document, for documents rendered for each request (if streaming)
+		self._streamed_docs = {self.get_url_path(doc.output_filename): doc for doc in self.docs} if stream else {}
+
+		# Current DB, for streamed documents - replaced along with self._pages
+		self._db = db
+
+		# Assets, by filename - cached along with the file's (mtime, size) when it was read
+		self._assets = {}
+
+		# URL path (with canonical query string for variants) -> Resource
+		# This dict is never modified once built, only replaced as a whole, so requests never see a partial update
+		self._pages = self.render_pages(db)
+
+		self._input_signature = self.get_input_signature()
+
+	def get_watched_filenames(self) -> List[str]:
+		return parsing.get_input_filenames(self.input_dir) + [doc.template_filename for doc in self.docs]
+
+	def get_input_signature(self) -> Tuple:
+		"""
+		:return: something that changes whenever any input file does
+		"""
+		signature = []
+		for filename in self.get_watched_filenames():
+			try:
+				stat = os.stat(filename)
+				signature.append((filename, stat.st_mtime_ns, stat.st_size))
+			except OSError:
+				signature.append((filename, None, None))
+		return tuple(signature)
+
+	def get_url_path(self, filename: str) -> str:
+		return '/' + os.path.relpath(filename).replace(os.sep, '/')
+
+	def render_pages(self, db: DB) -> Dict[str, Resource]:
+
+		print('Rendering pages')
+
+		pages = {}
+
+		# If streaming, these are rendered when requested instead
+		if not self.stream:
+			main_table = printing.render_main_table(db, jobs=self.jobs, compact=self.compact)
+			for doc in self.docs:
+				body = ''.join(printing.iter_document(doc, db, [main_table])).encode('utf-8')
+				pages[self.get_url_path(doc.output_filename)] = make_resource(body, 'text/html; charset=utf-8')
+
+		# Virtualized page, and the JSON data it renders from
+		virtual_doc = json_export.get_virtual_document(self.input_dir, self.output_dir)
+		body = ''.join(printing.iter_document(virtual_doc, db, [json_export.render_virtual_main_table()])).encode('utf-8')
+		pages[self.get_url_path(virtual_doc.output_filename)] = make_resource(body, 'text/html; charset=utf-8')
+
+		body = json_export.render_chart_data(db).encode('utf-8')
+		pages[self.get_url_path(json_export.get_json_filename(self.output_dir))] = make_resource(body, 'application/json')
+
+		print_doc = [doc for doc in self.docs if doc.is_print_version][0]
+		print_path = self.get_url_path(print_doc.output_filename)
+
+		variant_docs = variants.get_variant_documents(
+			db, self.variants, self.input_dir, self.output_print_dir, jobs=self.jobs, compact=self.compact)
+
+		for variant, (doc, main_table) in zip(self.variants, variant_docs):
+			body = ''.join(printing.iter_document(doc, db, [main_table])).encode('utf-8')
+			pages[print_path + '?' + variant.get_query_string()] = make_resource(body, 'text/html; charset=utf-8')
+
+		print('Rendered %i pages' % len(pages))
+
+		return pages
+
+	async def watch_inputs(self):
+		"""Poll input files, and re-render pages when they change"""
+
+		loop = asyncio.get_running_loop()
+
+		while True:
+			await asyncio.sleep(self.poll_interval)
+
+			signature = self.get_input_signature()
+			if signature == self._input_signature:
+				continue
+
+			print('Input files changed, reloading')
+
+			# Warnings from reloading have already been printed, so don't let them build up in utils.warnings for the
+			# life of the server
+			num_warnings_before = len(utils.warnings)
+
+			printing.clear_episode_title_cells_cache()
+
+			try:
+				# Parsing & rendering are slow, so do them in a thread to keep serving in the meantime
+				db = await loop.run_in_executor(None, self.load_db)
+				pages = await loop.run_in_executor(None, self.render_pages, db)
+			except Exception as e:
+				# Signature isn't updated, so this will be retried on the next poll (e.g. if a file was half-saved)
+				print('Failed to reload, still serving previous pages: %s' % str(e))
+				continue
+			finally:
+				del utils.warnings[num_warnings_before:]
+
+			self._input_signature = signature
+			self._db = db
+			self._pages = pages
+
+	def get_asset(self, path: str) -> Optional[Resource]:
+
+		rel_path = os.path.normpath(path.lstrip('/'))
+		if rel_path.startswith('..') or os.path.isabs(rel_path):
+			return None
+
+		# Only serve from output directories
+		allowed_dirs = [os.path.normpath(self.output_dir), os.path.normpath(self.output_print_dir)]
+		if not any([rel_path.startswith(allowed_dir + os.sep) for allowed_dir in allowed_dirs]):
+			return None
+
+		try:
+			stat = os.stat(rel_path)
+		except OSError:
+			return None
+
+		if not os.path.isfile(rel_path):
+			return None
+
+		cached = self._assets.get(rel_path)
+		if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+			return cached[1]
+
+		with open(rel_path, 'rb') as f:
+			body = f.read()
+
+		content_type = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+		if content_type.startswith('text/'):
+			content_type += '; charset=utf-8'
+
+		resource = make_resource(body, content_type, last_modified=stat.st_mtime)
+		self._assets[rel_path] = ((stat.st_mtime_ns, stat.st_size), resource)
+		return resource
+
+	def get_resource(self, path: str, query: str) -> Optional[Resource]:
+
+		pages = self._pages
+
+		# Check variants even if path isn't in pages, as the print version may be streamed but its variants aren't
+		if path in pages or path in self._streamed_docs:
+			variant = variants.get_variant_from_query(urllib.parse.parse_qs(query))
+			if variant is not None and (path + '?' + variant.get_query_string()) in pages:
+				return pages[path + '?' + variant.get_query_string()]
+
+		if path in pages:
+			return pages[path]
+
+		# Rendered for each request instead (see send_streamed_document), so don't serve any copy on disk
+		if path in self._streamed_docs:
+			return None
+
+		return self.get_asset(path)
+
+	async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		try:
+			await self.handle_request(reader, writer)
+		except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+			pass
+		finally:
+			writer.close()
+
+	async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+		# Raises LimitOverrunError if request headers are longer than _max_request_header_size
+		request = await reader.readuntil(b'\r\n\r\n')
+
+		lines = request.decode('latin-1').split('\r\n')
+
+		try:
+			method, target, _ = lines[0].split(' ', 2)
+		except ValueError:
+			self.send_response(writer, 400, 'Bad Request')
+			return
+
+		headers = {}
+		for line in lines[1:]:
+			name, sep, value = line.partition(':')
+			if sep:
+				headers[name.strip().lower()] = value.strip()
+
+		if method not in ('GET', 'HEAD'):
+			self.send_response(writer, 405, 'Method Not Allowed', extra_headers={'Allow': 'GET, HEAD'})
+			return
+
+		url = urllib.parse.urlsplit(target)
+		path = urllib.parse.unquote(url.path)
+
+		if path == '/':
+			self.send_response(writer, 302, 'Found', extra_headers={'Location': '/output/bookshow.html'})
+			return
+
+		resource = self.get_resource(path, url.query)
+
+		if resource is None and path in self._streamed_docs:
+			await self.send_streamed_document(writer, self._streamed_docs[path], headers, head_only=(method == 'HEAD'))
+			return
+
+		if resource is None:
+			self.send_response(writer, 404, 'Not Found')
+			return
+
+		common_headers = {
+			'ETag': resource.etag,
+			'Last-Modified': email.utils.formatdate(resource.last_modified, usegmt=True),
+			'Cache-Control': 'no-cache',
+			'Vary': 'Accept-Encoding',
+		}
+
+		if self.is_not_modified(resource, headers):
+			self.send_response(writer, 304, 'Not Modified', extra_headers=common_headers)
+			return
+
+		accepted_encodings = self.get_accepted_encodings(headers)
+
+		body = resource.body
+		for encoding in ('br', 'gzip'):
+			if encoding in resource.compressed and encoding in accepted_encodings:
+				body = resource.compressed[encoding]
+				common_headers['Content-Encoding'] = encoding
+				break
+
+		common_headers['Content-Type'] = resource.content_type
+
+		self.send_response(writer, 200, 'OK', body=body, extra_headers=common_headers, head_only=(method == 'HEAD'))
+		await writer.drain()
+
+	async def send_streamed_document(
+			self,
+			writer: asyncio.StreamWriter,
+			doc: printing.OutputDocument,
+			headers: Dict[str, str],
+			head_only=False):
+		"""Send document as a chunked response, rendering it as it is sent
+
+		Memory use doesn't depend on the size of the table (see printing.iter_document_bytes). There is no ETag, as that
+		would require rendering the whole document first.
+		"""
+
+		accepted_encodings = self.get_accepted_encodings(headers)
+
+		compression = None
+		for encoding in ('br', 'gzip'):
+			if encoding in accepted_encodings and (encoding != 'br' or brotli is not None):
+				compression = encoding
+				break
+
+		response_headers = {
+			'Content-Type': 'text/html; charset=utf-8',
+			'Cache-Control': 'no-cache',
+			'Vary': 'Accept-Encoding',
+			'Transfer-Encoding': 'chunked',
+		}
+		if compression is not None:
+			response_headers['Content-Encoding'] = compression
+
+		self.send_headers(writer, 200, 'OK', response_headers)
+
+		if head_only:
+			await writer.drain()
+			return
+
+		loop = asyncio.get_running_loop()
+
+		# Hold on to DB, in case it is replaced by a reload partway through
+		chunks = printing.iter_document_bytes(doc, self._db, compression=compression, compact=self.compact)
+
+		while True:
+			# Rendering is slow, so do it in a thread to keep serving other requests in the meantime
+			data = await loop.run_in_executor(None, next, chunks, None)
+			if data is None:
+				break
+
+			writer.write(b'%x\r\n' % len(data))
+			writer.write(data)
+			writer.write(b'\r\n')
+			await writer.drain()
+
+		writer.write(b'0\r\n\r\n')
+		await writer.drain()
+
+	@staticmethod
+	def get_accepted_encodings(headers: Dict[str, str]) -> List[str]:
+		return [enc.split(';')[0].strip() for enc in headers.get('accept-encoding', '').split(',')]
+
+	@staticmethod
+	def is_not_modified(resource: Resource, headers: Dict[str, str]) -> bool:
+
+		if 'if-none-match' in headers:
+			etags = [etag.strip() for etag in headers['if-none-match'].split(',')]
+			return resource.etag in etags or '*' in etags
+
+		if 'if-modified-since' in headers:
+			try:
+				since = email.utils.parsedate_to_datetime(headers['if-modified-since']).timestamp()
+			except (TypeError, ValueError):
+				return False
+			# HTTP dates only have 1 second resolution
+			return int(resource.last_modified) <= since
+
+		return False
+
+	@staticmethod
+	def send_response(
+			writer: asyncio.StreamWriter,
+			status: int,
+			reason: str,
+			body: Optional[bytes]=None,
+			extra_headers: Optional[Dict[str, str]]=None,
+			head_only=False):
+
+		headers = dict(extra_headers or {})
+
+		if status == 304:
+			body = b''
+		else:
+			if body is None:
+				body = ('%i %s\n' % (status, reason)).encode()
+				headers['Content-Type'] = 'text/plain; charset=utf-8'
+			headers['Content-Length'] = str(len(body))
+
+		ChartServer.send_headers(writer, status, reason, headers)
+		if not head_only:
+			writer.write(body)
+
+	@staticmethod
+	def send_headers(writer: asyncio.StreamWriter, status: int, reason: str, headers: Dict[str, str]):
+
+		headers = dict(headers)
+		headers['Connection'] = 'close'
+		headers['Date'] = email.utils.formatdate(usegmt=True)
+
+		response = 'HTTP/1.1 %i %s\r\n' % (status, reason)
+		response += ''.join(['%s: %s\r\n' % (name, value) for name, value in headers.items()])
+		response += '\r\n'
+
+		writer.write(response.encode('latin-1'))
+
+	async def serve_forever(self, host: str, port: int):
+		server = await asyncio.start_server(self.handle_connection, host, port, limit=_max_request_header_size)
+		print('Serving chart at http://%s:%i/' % (host, port))
+
+		watcher = asyncio.ensure_future(self.watch_inputs())
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			watcher.cancel()
+
+
+def serve(
+		db: DB,
+		load_db: Callable[[], DB],
+		host='127.0.0.1',
+		port=8000,
+		jobs=1,
+		poll_interval=1.0,
+		compact=False,
+		stream=False):
+	"""Serve chart over HTTP until interrupted
+
+	:param db: initial parsed data
+	:param load_db: function to (re)load DB when input files change
+	:param host:
+	:param port:
+	:param jobs: number of processes to render with
+	:param poll_interval: how often to check input files for changes, in seconds
+	:param compact: if True, will render compact main tables (see printing.iter_main_table)
+	:param stream: if True, main pages will be rendered for each request as they are sent (see ChartServer)
+	"""
+
+	chart_server = ChartServer(db, load_db, jobs=jobs, poll_interval=poll_interval, compact=compact, stream=stream)
+
+	try:
+		asyncio.run(chart_server.serve_forever(host, port))
+	except KeyboardInterrupt:
+		print('Stopped')
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from utils import *
+from book_show_types import *
+from typing import List, Optional, Tuple
+import columnar
+import parsing
+import profiling
+import hashlib
+import os
+import os.path
+import pickle
+
+
+# Increment this whenever the DB types change, so that old snapshots don't get loaded
+_snapshot_version = 2
+
+_snapshot_prefix = 'db-'
+_snapshot_ext = '.pickle'
+
+
+def get_files_hash(filenames: List[str], version: int) -> str:
+	"""
+	:param filenames:
+	:param version: format version of whatever is being cached, so that changing it invalidates old hashes
+	:return: hash of the contents of all files
+	"""
+	h = hashlib.sha256()
+	h.update(b'version %i\n' % version)
+
+	for filename in filenames:
+		with open(filename, 'rb') as f:
+			data = f.read()
+		h.update(b'%s %i\n' % (os.path.basename(filename).encode(), len(data)))
+		h.update(data)
+
+	return h.hexdigest()
+
+
+def get_input_hash(input_dir='input') -> str:
+	"""
+	:return: hash of the contents of all input files (and the snapshot version)
+	"""
+	return get_files_hash(parsing.get_input_filenames(input_dir), _snapshot_version)
+
+
+def get_snapshot_filename(cache_dir: str, input_hash: str) -> str:
+	return os.path.join(cache_dir, _snapshot_prefix + input_hash + _snapshot_ext)
+
+
+def load_snapshot(cache_dir: str, input_hash: str) -> Optional[Tuple[DB, List[str]]]:
+	"""
+	:return: (db, warnings from when it was parsed), or None if there is no valid snapshot for input_hash
+	"""
+
+	filename = get_snapshot_filename(cache_dir, input_hash)
+
+	if not os.path.isfile(filename):
+		return None
+
+	try:
+		with open(filename, 'rb') as f:
+			db, parse_warnings = pickle.load(f)
+	except Exception as e:
+		print('Failed to load snapshot %s (%s), will reparse' % (filename, str(e)))
+		return None
+
+	return db, parse_warnings
+
+
+def save_snapshot(db: DB, parse_warnings: List[str], cache_dir: str, input_hash: str):
+	"""Save snapshot, and delete any old snapshots in cache_dir"""
+
+	os.makedirs(cache_dir, exist_ok=True)
+
+	filename = get_snapshot_filename(cache_dir, input_hash)
+	temp_filename = filename + '.tmp'
+
+	# Columnar connections are cheap to rebuild, and would make the snapshot require NumPy to load
+	db_columnar = db.columnar
+	db.columnar = None
+	try:
+		with open(temp_filename, 'wb') as f:
+			pickle.dump((db, parse_warnings), f, protocol=pickle.HIGHEST_PROTOCOL)
+	finally:
+		db.columnar = db_columnar
+
+	# Atomic, so that another process never sees a partially written snapshot
+	os.replace(temp_filename, filename)
+
+	for other_filename in os.listdir(cache_dir):
+		if other_filename.startswith(_snapshot_prefix) and other_filename.endswith(_snapshot_ext):
+			other_filename = os.path.join(cache_dir, other_filename)
+			if other_filename != filename:
+				debug_print('Removing old snapshot %s' % other_filename)
+				os.remove(other_filename)
+
+
+def load_or_parse(input_dir='input', cache_dir='cache', build_columnar=False) -> DB:
+	"""Load DB from snapshot if inputs haven't changed since it was saved; otherwise parse & sanity check, and save a
+	new snapshot
+
+	:param input_dir:
+	:param cache_dir: directory snapshots are stored in
+	:param build_columnar: if True, will also build columnar connections (requires NumPy)
+	"""
+
+	input_hash = get_input_hash(input_dir)
+
+	with profiling.phase('load_snapshot'):
+		snapshot = load_snapshot(cache_dir, input_hash)
+
+	if snapshot is not None:
+		db, parse_warnings = snapshot
+		print("Loaded parsed data from snapshot: %s" % get_snapshot_filename(cache_dir, input_hash))
+
+		# Warnings would have been printed when this was originally parsed - print them again
+		for warning in parse_warnings:
+			warn(warning)
+
+		if build_columnar:
+			print("Building columnar connections")
+			with profiling.phase('build_columnar'):
+				db.columnar = columnar.ColumnarConnections(db)
+
+		return db
+
+	num_warnings_before = len(warnings)
+
+	db = parsing.do_parsing(input_dir, build_columnar=build_columnar)
+
+	print("")
+
+	print("Sanity checking data")
+	with profiling.phase('sanity_check'):
+		db.sanity_check()
+
+	with profiling.phase('save_snapshot'):
+		save_snapshot(db, warnings[num_warnings_before:], cache_dir, input_hash)
+	print("Saved snapshot: %s" % get_snapshot_filename(cache_dir, input_hash))
+
+	return db
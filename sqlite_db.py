@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from utils import *
+from book_show_types import *
+from typing import Iterable, List, Optional
+import columnar
+import parsing
+import profiling
+import snapshot
+import sqlite3
+
+
+# Increment this whenever the schema changes, so that databases imported with an old schema get re-imported
+_schema_version = 1
+
+# Connections are inserted this many at a time
+_connection_insert_batch_size = 10000
+
+_schema = '''
+CREATE TABLE meta (
+	key TEXT PRIMARY KEY,
+	value TEXT NOT NULL
+);
+
+CREATE TABLE warnings (
+	id INTEGER PRIMARY KEY,
+	message TEXT NOT NULL
+);
+
+CREATE TABLE books (
+	number INTEGER PRIMARY KEY,
+	position INTEGER NOT NULL UNIQUE,  -- Position in DB.books
+	name TEXT NOT NULL UNIQUE,
+	abbreviation TEXT NOT NULL
+);
+
+-- Real books that each combined book is made of
+CREATE TABLE combined_books (
+	combined_book INTEGER NOT NULL REFERENCES books (number),
+	position INTEGER NOT NULL,
+	member_book INTEGER NOT NULL REFERENCES books (number),
+	PRIMARY KEY (combined_book, position)
+);
+
+-- Chapters of real books only (combined books' chapters are in combined_order)
+CREATE TABLE chapters (
+	number INTEGER PRIMARY KEY,
+	book INTEGER NOT NULL REFERENCES books (number),
+	number_in_book INTEGER NOT NULL,
+	name TEXT NOT NULL,
+	pov TEXT NOT NULL,
+	occurred INTEGER NOT NULL,
+	UNIQUE (book, number_in_book)
+);
+
+CREATE INDEX chapters_by_book_and_name ON chapters (book, name);
+
+CREATE TABLE combined_order (
+	combined_book INTEGER NOT NULL REFERENCES books (number),
+	position INTEGER NOT NULL,
+	chapter INTEGER NOT NULL REFERENCES chapters (number),
+	PRIMARY KEY (combined_book, position)
+);
+
+CREATE TABLE seasons (
+	number INTEGER PRIMARY KEY
+);
+
+CREATE TABLE episodes (
+	number INTEGER PRIMARY KEY,
+	season INTEGER NOT NULL REFERENCES seasons (number),
+	number_in_season INTEGER NOT NULL,
+	name TEXT NOT NULL,
+	UNIQUE (season, number_in_season)
+);
+
+-- id is the order connections were parsed in, which is the order they are in each episode
+CREATE TABLE connections (
+	id INTEGER PRIMARY KEY,
+	episode INTEGER NOT NULL REFERENCES episodes (number),
+	chapter INTEGER NOT NULL REFERENCES chapters (number),
+	strength INTEGER NOT NULL,
+	major TEXT NOT NULL,  -- As given in the CSV, same as Connection.major
+	notes TEXT NOT NULL
+);
+
+CREATE INDEX connections_by_episode ON connections (episode, chapter);
+CREATE INDEX connections_by_chapter ON connections (chapter, episode);
+'''
+
+# In order they can be dropped in (i.e. referencing tables first)
+_tables = [
+	'connections', 'episodes', 'seasons', 'combined_order', 'chapters', 'combined_books', 'books', 'warnings', 'meta']
+
+
+def connect(filename: str) -> sqlite3.Connection:
+	# Transactions are started explicitly (see import_input), as otherwise sqlite3 wouldn't include DDL statements
+	conn = sqlite3.connect(filename, isolation_level=None)
+	conn.execute('PRAGMA foreign_keys = ON')
+	return conn
+
+
+def get_input_hash(input_dir='input') -> str:
+	"""
+	:return: hash of the contents of all input files (and the schema version)
+	"""
+	return snapshot.get_files_hash(parsing.get_input_filenames(input_dir), _schema_version)
+
+
+def get_stored_input_hash(conn: sqlite3.Connection) -> Optional[str]:
+	"""
+	:return: input hash the database was imported from, or None if it hasn't been imported into
+	"""
+	try:
+		row = conn.execute("SELECT value FROM meta WHERE key = 'input_hash'").fetchone()
+	except sqlite3.OperationalError:
+		return None
+	return row[0] if row is not None else None
+
+
+def import_input(conn: sqlite3.Connection, input_dir='input') -> DB:
+	"""Parse input files into the database, replacing anything already in it
+
+	Everything is imported in a single transaction, so the database is never left partially imported. Connections are
+	streamed into the database as they are parsed, so they are never all in memory at once.
+
+	The imported data is loaded back & sanity checked before the transaction is committed, so data that fails the
+	sanity check is never stored (and will be imported & checked again next time).
+
+	:return: DB loaded from the imported data
+	:raises: SanityCheckError if the data fails the sanity check
+	"""
+
+	input_hash = get_input_hash(input_dir)
+	num_warnings_before = len(warnings)
+
+	db = parsing.do_parsing(input_dir, connections=False)
+
+	print("")
+
+	# Commits on success, or rolls back if anything fails
+	with conn:
+		conn.execute('BEGIN')
+
+		for table in _tables:
+			conn.execute('DROP TABLE IF EXISTS %s' % table)
+
+		# Not executescript(), as that would commit (so _schema can't have ";" other than between statements)
+		for statement in _schema.split(';'):
+			if statement.strip():
+				conn.execute(statement)
+
+		conn.executemany(
+			'INSERT INTO books (number, position, name, abbreviation) VALUES (?, ?, ?, ?)',
+			[(book.number, position, book.name, book.abbreviation) for position, book in enumerate(db.books)])
+
+		conn.executemany(
+			'INSERT INTO combined_books (combined_book, position, member_book) VALUES (?, ?, ?)',
+			[
+				(book.number, position, member.number)
+				for book in db.books for position, member in enumerate(book.combined_books)])
+
+		conn.executemany(
+			'INSERT INTO chapters (number, book, number_in_book, name, pov, occurred) VALUES (?, ?, ?, ?, ?, ?)',
+			[
+				(
+					chapter.number, book.number, chapter.number_in_book, chapter.name, chapter.pov,
+					int(chapter.occurred))
+				for book in db.books if not book.is_combined() for chapter in book.chapters])
+
+		conn.executemany(
+			'INSERT INTO combined_order (combined_book, position, chapter) VALUES (?, ?, ?)',
+			[
+				(book.number, position, chapter.number)
+				for book in db.books if book.is_combined() for position, chapter in enumerate(book.chapters)])
+
+		conn.executemany('INSERT INTO seasons (number) VALUES (?)', [(season.number, ) for season in db.seasons])
+
+		conn.executemany(
+			'INSERT INTO episodes (number, season, number_in_season, name) VALUES (?, ?, ?, ?)',
+			[
+				(episode.number, season.number, episode.number_in_season, episode.name)
+				for season in db.seasons for episode in season.episodes])
+
+		connections_filename = parsing.get_input_filenames(input_dir)[-1]
+		print("Importing connections: %s" % connections_filename)
+
+		rows = []
+
+		def insert_rows():
+			conn.executemany(
+				'INSERT INTO connections (episode, chapter, strength, major, notes) VALUES (?, ?, ?, ?, ?)', rows)
+			rows.clear()
+
+		def add_row(connection: Connection):
+			rows.append((
+				connection.episode.number, connection.chapter.number, connection.strength, connection.major,
+				connection.notes))
+			if len(rows) >= _connection_insert_batch_size:
+				insert_rows()
+
+		stats = parsing.ConnectionIngestStats()
+		with profiling.phase('import_connections'):
+			parsing.warn_rejected_connections(
+				parsing.ingest_connections(connections_filename, db, stats, on_connection=add_row, add_to_db=False),
+				stats)
+			insert_rows()
+
+		parsing.print_connection_stats(stats)
+
+		conn.executemany(
+			'INSERT INTO warnings (message) VALUES (?)', [(warning, ) for warning in warnings[num_warnings_before:]])
+
+		with profiling.phase('load_sqlite'):
+			db = load_db(conn)
+
+		print("")
+		print("Sanity checking data")
+		with profiling.phase('sanity_check'):
+			db.sanity_check()
+
+		conn.execute("INSERT INTO meta (key, value) VALUES ('input_hash', ?)", (input_hash, ))
+
+	return db
+
+
+def _in_clause(column: str, values: Optional[List[int]]) -> str:
+	"""
+	:return: SQL condition restricting column to values (which must be ints); always true if values is None
+	"""
+	if values is None:
+		return '1'
+	return '%s IN (%s)' % (column, ','.join(['%i' % value for value in values]))
+
+
+def load_db(
+		conn: sqlite3.Connection,
+		book_numbers: Optional[Iterable[int]]=None,
+		season_numbers: Optional[Iterable[int]]=None) -> DB:
+	"""Load DB from database, optionally only some books & seasons
+
+	Only the requested rows are read, using the indexes. A partial DB can be printed like a full one, but will not pass
+	DB.sanity_check, as book, chapter & episode numbers are kept from the full DB.
+
+	:param conn:
+	:param book_numbers: books to load (if a combined book is included, the books it combines are loaded too); if None,
+	will load all books
+	:param season_numbers: seasons to load; if None, will load all seasons
+	:return: DB, with only connections between loaded episodes & chapters
+	"""
+
+	db = DB()
+
+	# Books
+
+	book_rows = conn.execute('SELECT number, name, abbreviation FROM books ORDER BY position').fetchall()
+
+	members = {}  # combined book number -> member book numbers
+	for combined_book_num, member_book_num in conn.execute(
+			'SELECT combined_book, member_book FROM combined_books ORDER BY combined_book, position'):
+		members.setdefault(combined_book_num, []).append(member_book_num)
+
+	if book_numbers is not None:
+		book_numbers = set(book_numbers)
+		for book_num in list(book_numbers):
+			book_numbers.update(members.get(book_num, []))
+
+	books = {
+		number: Book(number=number, name=name, abbreviation=abbreviation)
+		for number, name, abbreviation in book_rows
+		if book_numbers is None or number in book_numbers}
+
+	for book in books.values():
+		book.combined_books.extend([books[member_num] for member_num in members.get(book.number, [])])
+
+	real_book_numbers = None if book_numbers is None else sorted(
+		[number for number, book in books.items() if not book.is_combined()])
+
+	# Chapters
+
+	chapters = {}
+
+	for number, book_num, number_in_book, name, pov, occurred in conn.execute(
+			'SELECT number, book, number_in_book, name, pov, occurred FROM chapters WHERE %s ORDER BY number' %
+			_in_clause('book', real_book_numbers)):
+		chapter = Chapter(
+			number=number,
+			book=books[book_num],
+			number_in_book=number_in_book,
+			name=name,
+			pov=pov,
+			occurred=bool(occurred))
+		chapters[number] = chapter
+		chapter.book.chapters.append(chapter)
+
+	combined_book_numbers = [number for number, book in books.items() if book.is_combined()]
+
+	for combined_book_num, chapter_num in conn.execute(
+			'SELECT combined_book, chapter FROM combined_order WHERE %s ORDER BY combined_book, position' %
+			_in_clause('combined_book', combined_book_numbers)):
+		books[combined_book_num].chapters.append(chapters[chapter_num])
+
+	for book in books.values():
+		db.add_book(book)
+
+	# Seasons & episodes
+
+	if season_numbers is not None:
+		season_numbers = sorted(set(season_numbers))
+
+	for (number, ) in conn.execute(
+			'SELECT number FROM seasons WHERE %s ORDER BY number' % _in_clause('number', season_numbers)):
+		db.add_season(Season(number=number))
+
+	episodes = {}
+
+	for number, season_num, number_in_season, name in conn.execute(
+			'SELECT number, season, number_in_season, name FROM episodes WHERE %s ORDER BY number' %
+			_in_clause('season', season_numbers)):
+		season = db.find_season(season_num)
+		episode = Episode(number=number, number_in_season=number_in_season, season=season, name=name)
+		episodes[number] = episode
+		db.add_episode(season, episode)
+
+	# Connections
+
+	if book_numbers is None and season_numbers is None:
+		query = 'SELECT episode, chapter, strength, major, notes FROM connections ORDER BY id'
+	else:
+		query = '''
+			SELECT connections.episode, connections.chapter, strength, major, notes
+			FROM connections
+			JOIN episodes ON episodes.number = connections.episode
+			JOIN chapters ON chapters.number = connections.chapter
+			WHERE %s AND %s
+			ORDER BY connections.id''' % (
+			_in_clause('episodes.season', season_numbers), _in_clause('chapters.book', real_book_numbers))
+
+	for episode_num, chapter_num, strength, major, notes in conn.execute(query):
+		db.add_connection(Connection(
+			episode=episodes[episode_num],
+			chapter=chapters[chapter_num],
+			strength=strength,
+			major=major,
+			notes=notes))
+
+	return db
+
+
+def load_or_import(filename: str, input_dir='input', build_columnar=False) -> DB:
+	"""Load DB from SQLite database, first importing input files into it if they have changed since the last import
+
+	:param filename: SQLite database file (will be created if it doesn't exist)
+	:param input_dir:
+	:param build_columnar: if True, will also build columnar connections (requires NumPy)
+	"""
+
+	conn = connect(filename)
+
+	try:
+		if get_stored_input_hash(conn) != get_input_hash(input_dir):
+			with profiling.phase('import'):
+				db = import_input(conn, input_dir)
+			print("Imported input files into SQLite database: %s" % filename)
+		else:
+			print("Loading from SQLite database: %s" % filename)
+
+			# Warnings would have been printed when this was originally imported - print them again
+			for (warning, ) in conn.execute('SELECT message FROM warnings ORDER BY id'):
+				warn(warning)
+
+			# Data is only stored once it has passed the sanity check, so no need to check again
+			with profiling.phase('load_sqlite'):
+				db = load_db(conn)
+
+	finally:
+		conn.close()
+
+	if build_columnar:
+		print("Building columnar connections")
+		with profiling.phase('build_columnar'):
+			db.columnar = columnar.ColumnarConnections(db)
+
+	return db
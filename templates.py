@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+import os
+import re
+import threading
+
+
+# A slot is a line consisting only of a named HTML comment, e.g. "<!--table-->"
+_slot_re = re.compile(r'^\s*<!--(\w+)-->\s*$')
+
+
+@dataclass(frozen=True)
+class Template:
+	"""HTML template, split at its slots
+
+	Slot lines are kept in the output (at the end of the part before them), so content for a slot goes right after its
+	line.
+	"""
+	parts: Tuple[str, ...]  # Text before the first slot, between each pair of slots, and after the last slot
+	slots: Tuple[str, ...]  # Slot names, in the order they appear
+
+	# Cache of split_at results for when no other slots are filled in, by slot
+	_splits: Dict = field(default_factory=dict, repr=False, compare=False)
+
+	def render(self, **slot_contents: str) -> str:
+		"""
+		:param slot_contents: content to put in each slot, by slot name; slots not given are left empty
+		:return: complete text
+		"""
+		chunks = [self.parts[0]]
+		for slot, part in zip(self.slots, self.parts[1:]):
+			chunks.append(slot_contents.get(slot, ''))
+			chunks.append(part)
+		return ''.join(chunks)
+
+	def split_at(self, slot: str, **slot_contents: str) -> Tuple[str, str]:
+		"""
+		:param slot: slot to split at
+		:param slot_contents: content to put in other slots, by slot name
+		:return: (text up to and including slot line, text after slot)
+		"""
+
+		if not slot_contents:
+			split = self._splits.get(slot)
+			if split is not None:
+				return split
+
+		if slot not in self.slots:
+			raise ValueError('Error: line <!--%s--> not found' % slot)
+
+		idx = self.slots.index(slot)
+
+		before = Template(parts=self.parts[:idx + 1], slots=self.slots[:idx]).render(**slot_contents)
+		after = Template(parts=self.parts[idx + 1:], slots=self.slots[idx + 1:]).render(**slot_contents)
+
+		if not slot_contents:
+			self._splits[slot] = (before, after)
+
+		return before, after
+
+
+def split_template(text: str, required_slots: Iterable[str]=()) -> Template:
+	"""
+	:param text: template text
+	:param required_slots: names of slots that must be in the template
+	:raises: ValueError if any of required_slots are missing
+	"""
+
+	parts = []
+	slots = []
+
+	# Keep track of position, so parts are slices of the original text
+	part_start = 0
+	position = 0
+
+	for line in text.splitlines(keepends=True):
+		position += len(line)
+
+		if not line.endswith('\n'):
+			continue
+
+		match = _slot_re.match(line)
+		if match:
+			parts.append(text[part_start:position])
+			slots.append(match.group(1))
+			part_start = position
+
+	# Text after the last complete line has never been output (the templates don't end with a newline, so this has
+	# always dropped the final "</html>"), so leave it out to keep output the same
+	last_part = text[part_start:]
+	parts.append(last_part[:last_part.rfind('\n') + 1])
+
+	for slot in required_slots:
+		if slot not in slots:
+			raise ValueError('Error: line <!--%s--> not found' % slot)
+
+	return Template(parts=tuple(parts), slots=tuple(slots))
+
+
+# Loaded templates: filename -> ((mtime, size), Template)
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+
+def load_template(filename: str, required_slots: Iterable[str]=()) -> Template:
+	"""Load & split template, or get it from the cache if the file hasn't changed since it was last loaded
+
+	:param filename:
+	:param required_slots: see split_template
+	"""
+
+	stat = os.stat(filename)
+	key = (stat.st_mtime_ns, stat.st_size)
+
+	with _template_cache_lock:
+		cached = _template_cache.get(filename)
+
+	if cached is not None and cached[0] == key:
+		template = cached[1]
+	else:
+		with open(filename, 'r') as f:
+			template = split_template(f.read())
+
+		with _template_cache_lock:
+			_template_cache[filename] = (key, template)
+
+	for slot in required_slots:
+		if slot not in template.slots:
+			raise ValueError('Error: line <!--%s--> not found' % slot)
+
+	return template
+
+
+def clear_template_cache(filename: Optional[str]=None):
+	"""
+	:param filename: template to remove from cache; if None, will clear whole cache
+	"""
+	with _template_cache_lock:
+		if filename is None:
+			_template_cache.clear()
+		else:
+			_template_cache.pop(filename, None)
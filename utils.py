@@ -28,8 +28,11 @@ A note from the author:
 	CC license.
 """
 
+import bisect
+import functools
+import itertools
 import string
-from typing import List, Callable, Optional, Union
+from typing import List, Dict, Hashable, Callable, Optional, Union
 
 
 _debug = False
@@ -84,6 +87,43 @@ def find_unique(list: List, matching_function: Callable, throw_if_not_found=True
 	return vals[0]
 
 
+def add_to_index(index: Dict, key: Hashable, item):
+	"""Add an item to a lookup index, for later use with find_in_index()
+
+	Index values are lists, so that duplicate keys can still be detected at lookup time
+
+	:param index: dict to add to
+	:param key: key to file item under
+	:param item: the item
+	"""
+	index.setdefault(key, []).append(item)
+
+
+def find_in_index(index: Dict, key: Hashable, throw_if_not_found=True):
+	"""Find an item in an index built with add_to_index()
+	Same behavior as find_unique(), but O(1) instead of scanning the whole list
+
+	:param index: index to find in
+	:param key: key to look up
+	:param throw_if_not_found: if True, will throw if not found; if false, will return None
+	:return: the item
+	:raises: ValueError if item is not in index or if multiple matches
+	"""
+
+	vals = index.get(key, [])
+
+	if len(vals) == 0:
+		if throw_if_not_found:
+			raise ValueError('Failed to find item in list')
+		else:
+			return None
+
+	elif len(vals) > 1:
+		raise ValueError('Multiple matches in list')
+
+	return vals[0]
+
+
 def htmlize_string(s: str) -> str:
 	"""Replace characters with HTML escape characters"""
 	return s.replace('&', '&amp;').replace('"', '&quot;')
@@ -109,6 +149,37 @@ assert to_roman_numeral(28) == 'XXVIII'
 assert to_roman_numeral(39) == 'XXXIX'
 
 
+# Approximate display widths of characters, in typical characters
+# Earlier entries take priority, e.g. 'i' is 0.5 even though it is also in ascii_lowercase
+_char_widths = {}
+for _chars, _width in [
+		('.\'', 0.33),
+		(' iIl', 0.5),
+		('ACDGmw', 1.25),
+		('MOQW', 1.5),
+		(string.ascii_lowercase + string.ascii_uppercase + string.digits + '?', 1.0)]:
+	for _c in _chars:
+		_char_widths.setdefault(_c, _width)
+
+
+def _char_display_widths(s: str) -> List[float]:
+	widths = []
+	for c in s:
+		width = _char_widths.get(c)
+		if width is None:
+			print('WARNING: unknown char ' + c + ' in string ' + s)
+			width = 1.0
+		widths.append(width)
+	return widths
+
+
+def _display_len_prefix_sums(s: str) -> List[float]:
+	"""
+	:return: list where item n is display_string_len_approx(s[:n])
+	"""
+	return [0.0] + list(itertools.accumulate(_char_display_widths(s)))
+
+
 def display_string_len_approx(s: str) -> float:
 	"""Determine approximate display string length
 
@@ -118,31 +189,16 @@ def display_string_len_approx(s: str) -> float:
 	:param s: string to measure
 	:return: string length, in typical characters
 	"""
-
-	n = 0.0
-	# Iterate 1 character at a time
-	for c in s:
-		if c in '.\'':
-			n += 0.33
-		elif c in ' iIl':
-			n += 0.5
-		elif c in 'ACDGmw':
-			n += 1.25
-		elif c in 'MOQW':
-			n += 1.5
-		elif c in string.ascii_lowercase + string.ascii_uppercase + string.digits + '?':
-			n += 1.0
-		else:
-			print('WARNING: unknown char ' + c + ' in string ' + s)
-			n += 1.0
-
-	return n
+	return _display_len_prefix_sums(s)[-1]
 
 
+@functools.lru_cache(maxsize=4096)
 def abbrev_string(s: str, num_char: Union[float, int], prefix: Optional[str]=None) -> str:
 	"""Abbreviate string to fit within num_char as best possible, trying not to split words if possible
 	Will add "..." if abbreviated
 
+	Results are cached, as the same chapter names get abbreviated several times
+
 	:param s: String to be abbreviated
 	:param num_char: Max length (according to display_string_len_approx)
 	:param prefix: Something to prepend to string, that will always be prepended in full (e.g. prepending book
@@ -161,8 +217,11 @@ def abbrev_string(s: str, num_char: Union[float, int], prefix: Optional[str]=Non
 		# Make room in character limit for prefix
 		num_char -= display_string_len_approx(prefix)
 
+	# Prefix sums of character widths, so that the length of any prefix of s is a single lookup
+	s_lens = _display_len_prefix_sums(s)
+
 	# Check if we even need to abbreviate at all
-	if display_string_len_approx(s) <= num_char:
+	if s_lens[-1] <= num_char:
 		return prefix + s
 
 	# Once we reach this point, we know we need to abbreviate.
@@ -170,23 +229,26 @@ def abbrev_string(s: str, num_char: Union[float, int], prefix: Optional[str]=Non
 	num_char -= display_string_len_approx('...')
 
 	# Try taking as many whole words as we can fit
+	# word_lens[n] is the length of the first n words joined by spaces - these are increasing, so binary search for the
+	# first one that doesn't fit
 	ss = s.split()
-	num_words = len(ss)
-	out_str = ''
-	for n in range(num_words):
-		if display_string_len_approx(' '.join(ss[0:n])) < num_char:
-			out_str = ' '.join(ss[0:n])
-		else:
-			break
+	joined = ' '.join(ss)
+	joined_lens = _display_len_prefix_sums(joined)
+
+	word_lens = [0.0]
+	end_idx = 0
+	for word in ss[:-1]:
+		end_idx += len(word)
+		word_lens.append(joined_lens[end_idx])
+		end_idx += 1  # Space
+
+	num_words = bisect.bisect_left(word_lens, num_char) - 1
+	out_str = ' '.join(ss[0:num_words]) if num_words > 0 else ''
 
 	# Now check if this ended up abbreviating to blank or just 'the'
 	# If so, instead take as many characters as possible
 	if (out_str == '') or (out_str.lower() == 'the'):
-		out_str = ''
-		for c in s:
-			if display_string_len_approx(out_str + c) >= num_char:
-				break
-			out_str += c
+		out_str = s[:bisect.bisect_left(s_lens, num_char, lo=1) - 1]
 
 	# If it ended on an apostrophe, remove it
 	if out_str[-1:] == "'":
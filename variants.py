@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+Game of Thrones chapters vs episodes chart generator
+Copyright (c) 2013-2018, Joel Geddert
+
+This script generates an HTML file of the table.
+
+Software License:
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A note from the author:
+	The original chart generated by this code, as well as all remaining applicable
+	source & asset files (except where noted), are licensed under a Creative Commons
+	BY-SA 4.0 license <http://creativecommons.org/licenses/by-sa/4.0/>. If you are
+	going to use any of this code to create a derivative work, please respect this
+	CC license.
+"""
+
+
+from book_show_types import *
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import concurrent.futures
+import itertools
+import os.path
+import printing
+
+
+# Possible values of each print version query string parameter (see output-print/js/got-print.js)
+_variant_params = {
+	'color': [0, 1],
+	'combine': [0, 1],
+	'spoilers': [0, 1, 2],
+}
+
+
+# What the print version does when a parameter is missing from its query string
+_variant_param_defaults = {
+	'color': 0,
+	'combine': 0,
+	'spoilers': 2,
+}
+
+
+@dataclass(frozen=True)
+class PrintVariant:
+	"""One combination of the print version's query string settings"""
+	color: int
+	combine: int
+	spoilers: int
+
+	def get_query_string(self) -> str:
+		return 'color=%i&combine=%i&spoilers=%i' % (self.color, self.combine, self.spoilers)
+
+	def get_filename(self) -> str:
+		return 'bookshow_print_color%i_combine%i_spoilers%i.html' % (self.color, self.combine, self.spoilers)
+
+	def get_book_numbers(self, db: DB) -> Tuple[int, ...]:
+		"""
+		:return: numbers of books to include in table - only depends on combine, so variants with the same combine
+		setting can share the same table
+		"""
+		combined_book_members = [member for book in db.books for member in book.combined_books]
+
+		if self.combine:
+			books = [book for book in db.books if not any([book is member for member in combined_book_members])]
+		else:
+			books = [book for book in db.books if not book.is_combined()]
+
+		return tuple(book.number for book in books)
+
+
+def parse_variant_matrix(specs: Iterable[str]) -> List[PrintVariant]:
+	"""Parse variant matrix from command line
+
+	:param specs: strings like "color=0,1" or "spoilers=2". Parameters not given will take all possible values.
+	:return: every combination of the given parameter values
+	:raises: ValueError if spec is invalid
+	"""
+
+	values = dict(_variant_params)
+
+	for spec in specs:
+		name, _, vals = spec.partition('=')
+
+		if name not in _variant_params:
+			raise ValueError('Unknown variant parameter "%s" (must be one of: %s)' % (
+				name, ', '.join(_variant_params.keys())))
+
+		try:
+			vals = [int(val) for val in vals.split(',')]
+		except ValueError:
+			raise ValueError('Invalid variant values: "%s"' % spec)
+
+		if not all([val in _variant_params[name] for val in vals]):
+			raise ValueError('Invalid variant values: "%s" (%s must be one of: %s)' % (
+				spec, name, ', '.join([str(val) for val in _variant_params[name]])))
+
+		values[name] = vals
+
+	return [
+		PrintVariant(color=color, combine=combine, spoilers=spoilers)
+		for color, combine, spoilers in itertools.product(values['color'], values['combine'], values['spoilers'])
+	]
+
+
+def get_variant_from_query(query: Dict[str, List[str]]) -> Optional[PrintVariant]:
+	"""
+	:param query: parsed query string, as returned by urllib.parse.parse_qs
+	:return: variant selected by query, or None if query has no variant parameters, or has invalid values
+	"""
+
+	if not any([name in query for name in _variant_params]):
+		return None
+
+	values = dict(_variant_param_defaults)
+
+	for name in _variant_params:
+		if name not in query:
+			continue
+
+		try:
+			values[name] = int(query[name][-1])
+		except ValueError:
+			return None
+
+		if values[name] not in _variant_params[name]:
+			return None
+
+	return PrintVariant(**values)
+
+
+# DB for process pool workers, so it only needs to be sent to each worker once
+_worker_db = None
+
+
+def _init_worker(db: DB):
+	global _worker_db
+	_worker_db = db
+
+
+def _render_main_table(book_numbers: Tuple[int, ...], compact: bool) -> str:
+	books = [book for book in _worker_db.books if book.number in book_numbers]
+	return printing.render_main_table(_worker_db, books=books, compact=compact)
+
+
+def render_main_tables(
+		db: DB,
+		book_number_sets: List[Tuple[int, ...]],
+		jobs: int,
+		compact=False) -> Dict[Tuple[int, ...], str]:
+	"""
+	:param db:
+	:param book_number_sets: each set of books to render a table for
+	:param jobs: max number of worker processes; if 1 (or only 1 table), will render in this process
+	:param compact: see printing.iter_main_table
+	:return: dict of book numbers -> rendered main table
+	"""
+
+	jobs = min(jobs, len(book_number_sets))
+
+	if jobs <= 1:
+		_init_worker(db)
+		return {book_numbers: _render_main_table(book_numbers, compact) for book_numbers in book_number_sets}
+
+	with concurrent.futures.ProcessPoolExecutor(
+			max_workers=jobs, initializer=_init_worker, initargs=(db,)) as executor:
+		tables = executor.map(_render_main_table, book_number_sets, [compact] * len(book_number_sets))
+		return dict(zip(book_number_sets, tables))
+
+
+def get_variant_documents(
+		db: DB,
+		variants: List[PrintVariant],
+		input_dir='input',
+		output_print_dir='output-print',
+		jobs=1,
+		compact=False) -> List[Tuple[printing.OutputDocument, str]]:
+	"""Render main tables for print version variants
+
+	Variants only need different tables if they include different books; otherwise they share the same table, and just
+	differ in their static query string.
+
+	:param db:
+	:param variants:
+	:param input_dir:
+	:param output_print_dir:
+	:param jobs: max number of processes to render tables with
+	:param compact: see printing.iter_main_table
+	:return: list of (document, rendered main table for it), in same order as variants
+	"""
+
+	template_filename = os.path.join(input_dir, 'template-print.html')
+
+	variant_books = {variant: variant.get_book_numbers(db) for variant in variants}
+	book_number_sets = sorted(set(variant_books.values()))
+
+	print('Rendering %i tables for %i variants' % (len(book_number_sets), len(variants)))
+	main_tables = render_main_tables(db, book_number_sets, jobs, compact)
+
+	docs_and_main_tables = []
+	for variant in variants:
+		doc = printing.OutputDocument(
+			template_filename=template_filename,
+			output_filename=os.path.join(output_print_dir, variant.get_filename()),
+			is_print_version=True,
+			static_query=variant.get_query_string())
+		docs_and_main_tables.append((doc, main_tables[variant_books[variant]]))
+
+	return docs_and_main_tables
+
+
+def do_variant_printing(
+		db: DB,
+		variants: List[PrintVariant],
+		input_dir='input',
+		output_print_dir='output-print',
+		jobs=1,
+		compact=False):
+	"""Write a static print version HTML file for each variant (see get_variant_documents)"""
+	printing.write_documents(get_variant_documents(db, variants, input_dir, output_print_dir, jobs, compact), db)